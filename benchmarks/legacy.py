@@ -0,0 +1,48 @@
+# The recursive form encoder _api_encode replaced, kept as a reference
+# point for the api_encode benchmark.
+import calendar
+import datetime
+import time
+
+from replyify import utils
+
+
+def _encode_datetime(dttime):
+    if dttime.tzinfo and dttime.tzinfo.utcoffset(dttime) is not None:
+        utc_timestamp = calendar.timegm(dttime.utctimetuple())
+    else:
+        utc_timestamp = time.mktime(dttime.timetuple())
+
+    return int(utc_timestamp)
+
+
+def _encode_nested_dict(key, data, fmt='%s[%s]'):
+    d = {}
+    for subkey, subvalue in data.items():
+        d[fmt % (key, subkey)] = subvalue
+    return d
+
+
+def _api_encode(data):
+    for key, value in data.items():
+        key = utils.utf8(key)
+        if value is None:
+            continue
+        elif hasattr(value, 'replyify_guid'):
+            yield (key, value.replyify_guid)
+        elif isinstance(value, list) or isinstance(value, tuple):
+            for sv in value:
+                if isinstance(sv, dict):
+                    subdict = _encode_nested_dict(key, sv, fmt='%s[][%s]')
+                    for k, v in _api_encode(subdict):
+                        yield (k, v)
+                else:
+                    yield ('%s[]' % (key,), utils.utf8(sv))
+        elif isinstance(value, dict):
+            subdict = _encode_nested_dict(key, value)
+            for subkey, subvalue in _api_encode(subdict):
+                yield (subkey, subvalue)
+        elif isinstance(value, datetime.datetime):
+            yield (key, _encode_datetime(value))
+        else:
+            yield (key, utils.utf8(value))
@@ -0,0 +1,420 @@
+'''
+Microbenchmarks for the CPU-bound hot paths of the bindings.
+
+    python benchmarks/run.py               # compare against baseline.json
+    python benchmarks/run.py --update      # record a new baseline
+    python benchmarks/run.py -k encode     # only benchmarks matching "encode"
+    python benchmarks/run.py --sizes       # request body sizes per encoding
+    python benchmarks/run.py -k import     # only the `import replyify` check
+
+Every benchmark reports the best per-call time over `--repeat` rounds,
+interleaved across benchmarks; `--update` uses more and longer rounds.
+Times are divided by a fixed pure-Python calibration loop measured in
+the same rounds, so baselines recorded on one machine remain meaningful
+on another.
+
+The run fails (exit status 1) when a benchmark is slower than its
+baseline by more than `--threshold`, widened by the spread measured
+across rounds on a noisy machine, and still is when measured again.  It
+also fails when `import replyify` loads the API, resource or transport
+modules eagerly, or takes longer than `--import-budget` seconds.
+'''
+import argparse
+import copy
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+
+try:
+    from urllib import parse as url_parse
+except ImportError:
+    import urlparse as url_parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import legacy  # noqa: E402
+import replyify  # noqa: E402
+from replyify import api, resources, utils  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+# Modules `import replyify` must leave to first use.
+LAZY_MODULES = (
+    'replyify.api',
+    'replyify.resources',
+    'replyify.http_client',
+    'requests',
+    'urllib3',
+    'pycurl',
+    'httpx',
+    'h2',
+    'brotli',
+    'google.appengine',
+)
+
+
+# Fixtures
+
+
+def contact(i):
+    return {
+        'guid': 'c0a8f2d4-%04d-4c6e-9a1b-5f7e3d2c1b0a' % i,
+        'object': 'contact',
+        'email': 'person%d@example.com' % i,
+        'first_name': 'First%d' % i,
+        'last_name': 'Last%d' % i,
+        'company': 'Company %d' % (i % 37),
+        'title': 'Director of Engineering',
+        'phone': '+1 555 01%02d' % (i % 100),
+        'status': 'active',
+        'created': 1660000000 + i,
+        'modified': 1660500000 + i,
+        'tags': [{'guid': 'tag-%d' % t, 'name': 'Tag %d' % t} for t in range(3)],
+        'custom': dict(('field_%d' % f, 'value %d' % f) for f in range(10)),
+        'campaigns': [{'guid': 'cmp-%d' % c, 'status': 'sent', 'step': c} for c in range(2)],
+    }
+
+
+CONTACT = contact(1)
+PAGE = {
+    'object': 'list',
+    'url': '/contact/v1',
+    'has_more': True,
+    'data': [contact(i) for i in range(100)],
+}
+PAGE_BODY = json.dumps(PAGE)
+UPDATE_PARAMS = {
+    'first_name': 'Jane',
+    'custom': dict(('field_%d' % f, 'updated %d' % f) for f in range(10)),
+    'tags': ['tag-%d' % t for t in range(5)],
+    'metadata': {'source': 'import', 'batch': {'id': 42, 'rows': [1, 2, 3]}},
+    'unsubscribed': False,
+    'score': 12.5,
+}
+
+TEMPLATE = {
+    'name': 'Q4 follow-up',
+    'subject': 'Following up on {{company}}',
+    'body': ''.join(
+        '<p>Hi {{first_name}}, paragraph %d of the follow-up about {{company}} and '
+        'how teams like yours cut their response times.</p>\n' % i for i in range(60)),
+    'variables': ['first_name', 'company', 'title'],
+    'settings': {'track_opens': True, 'track_clicks': True, 'signature': 'sig-1'},
+}
+BODY_PAYLOADS = [
+    ('contacts', {'contacts': PAGE['data']}),
+    ('template', TEMPLATE),
+]
+BODY_ENCODINGS = [
+    ('form', False),
+    ('json', False),
+    ('form', True),
+    ('json', True),
+]
+
+
+def encode_body(params, request_format, gzip):
+    # What ReplyifyApi.request_raw sends for a POST with these settings.
+    if request_format == 'json':
+        body = utils.json.dumps(api._json_encode(params))
+    else:
+        body = url_parse.urlencode(list(api._api_encode(params)))
+    if gzip:
+        body = api._gzip_encode(body)
+    return body
+
+
+def _body_name(payload, request_format, gzip):
+    return 'body_%s_%s%s' % (payload, request_format, '_gzip' if gzip else '')
+
+
+def wire_sizes():
+    sizes = {}
+    for payload, params in BODY_PAYLOADS:
+        for request_format, gzip in BODY_ENCODINGS:
+            sizes[_body_name(payload, request_format, gzip)] = len(encode_body(params, request_format, gzip))
+    return sizes
+
+
+class _NoClient(object):
+    name = 'benchmark'
+
+
+# Benchmarks
+
+
+ENCODE_PARAMS = dict(UPDATE_PARAMS, contacts=PAGE['data'][:10])
+
+
+def bench_api_encode():
+    params = ENCODE_PARAMS
+    return lambda: list(api._api_encode(params))
+
+
+def bench_api_encode_legacy():
+    params = ENCODE_PARAMS
+    assert list(legacy._api_encode(params)) == list(api._api_encode(params))
+    return lambda: list(legacy._api_encode(params))
+
+
+def bench_interpret_response():
+    requestor = api.ReplyifyApi(access_token='bench', client=_NoClient())
+    body = PAGE_BODY
+    return lambda: requestor.interpret_response(body, 200, {})
+
+
+def bench_convert_to_replyify_object():
+    page = PAGE
+    return lambda: resources.convert_to_replyify_object(page, 'bench')
+
+
+def bench_refresh_from():
+    obj = resources.Contact(CONTACT['guid'], 'bench')
+    values = CONTACT
+    return lambda: obj.refresh_from(values)
+
+
+def bench_serialize():
+    objs = resources.convert_to_replyify_object(copy.deepcopy(PAGE['data'][:20]), 'bench')
+    for obj in objs:
+        obj.first_name = 'Jane'
+        obj.custom['field_3'] = 'changed'
+        obj.tags = ['tag-1', 'tag-2']
+    return lambda: [obj.serialize(None) for obj in objs]
+
+
+def bench_multipart():
+    payload = b'x' * 64 * 1024
+    params = {'name': 'contacts.csv', 'campaign': 'cmp-1', 'notify': 'true'}
+
+    def run():
+        upload = io.BytesIO(payload)
+        upload.name = 'contacts.csv'
+        generator = utils.MultipartDataGenerator()
+        generator.add_params(dict(params, file=upload))
+        return generator.get_post_data()
+    return run
+
+
+def bench_body(params, request_format, gzip):
+    return lambda: lambda: encode_body(params, request_format, gzip)
+
+
+BENCHMARKS = [
+    ('api_encode', bench_api_encode),
+    ('api_encode_legacy', bench_api_encode_legacy),
+    ('interpret_response', bench_interpret_response),
+    ('convert_to_replyify_object', bench_convert_to_replyify_object),
+    ('refresh_from', bench_refresh_from),
+    ('serialize', bench_serialize),
+    ('multipart', bench_multipart),
+] + [
+    (_body_name(payload, request_format, gzip), bench_body(params, request_format, gzip))
+    for payload, params in BODY_PAYLOADS
+    for request_format, gzip in BODY_ENCODINGS
+]
+
+
+def _calibrate():
+    data = list(range(1000))
+    return lambda: sorted(dict((str(i), i) for i in data).items())
+
+
+def _calibrated_timer(func, min_time):
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            return timer, number
+        number *= 2 if elapsed == 0 else max(2, int(min_time / elapsed * 1.2))
+
+
+MIN_REPEAT = 5
+MIN_TIME = 0.05
+# A baseline is the reference every later run is judged against, so it is
+# recorded with more and longer rounds than a comparison.
+UPDATE_REPEAT = 40
+UPDATE_MIN_TIME = 0.2
+
+
+class Result(object):
+
+    def __init__(self, samples, calibration):
+        best, cal = min(samples), min(calibration)
+        self.value = best / cal
+        # How far the lower-quartile round is from the best one, for both
+        # the benchmark and the calibration loop.
+        self.noise = _spread(samples) + _spread(calibration)
+
+
+def _spread(samples):
+    ordered = sorted(samples)
+    return ordered[len(ordered) // 4] / ordered[0] - 1
+
+
+def measure(funcs, repeat, min_time=0.1):
+    '''
+    Time every function in `funcs` (which must include the calibration
+    loop under the key None) and return a `Result` per benchmark.  Rounds
+    are interleaved across all functions so that a burst of noise on a
+    busy machine affects every measurement alike instead of one benchmark.
+    '''
+    repeat, min_time = max(repeat, MIN_REPEAT), max(min_time, MIN_TIME)
+    timers = dict((name, _calibrated_timer(func, min_time)) for name, func in funcs.items())
+    samples = dict((name, []) for name in timers)
+    for _ in range(repeat):
+        for name, (timer, number) in timers.items():
+            samples[name].append(timer.timeit(number) / number)
+    calibration = samples.pop(None)
+    return dict((name, Result(values, calibration)) for name, values in samples.items())
+
+
+def regressions(results, baseline, threshold):
+    slower = {}
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is not None and result.value / base - 1 > threshold + result.noise:
+            slower[name] = result
+    return slower
+
+
+def import_profile():
+    '''
+    Run `import replyify` in a fresh interpreter under `-X importtime` and
+    return the cumulative import time in seconds of every module loaded.
+    '''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')]))
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', 'import replyify'],
+                               stderr=subprocess.PIPE, env=env, universal_newlines=True)
+    _, stderr = process.communicate()
+    if process.returncode:
+        raise RuntimeError('import replyify failed:\n%s' % stderr)
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        try:
+            modules[name.strip()] = int(cumulative) / 1e6
+        except ValueError:
+            continue  # the column header
+    return modules
+
+
+def check_import(budget, runs=3):
+    '''
+    Return a list of problems with `import replyify`: modules in
+    LAZY_MODULES that were loaded, and the best of `runs` import times if
+    it exceeds `budget` seconds.
+    '''
+    if sys.version_info < (3, 7):
+        print('import replyify: skipped, -X importtime needs Python 3.7+')
+        return []
+    profiles = [import_profile() for _ in range(runs)]
+    eager = sorted(name for name in profiles[0]
+                   if any(name == lazy or name.startswith(lazy + '.') for lazy in LAZY_MODULES))
+    elapsed = min(profile['replyify'] for profile in profiles)
+    print('%-28s %9.1fms (budget %.0fms)' % ('import replyify', elapsed * 1000, budget * 1000))
+
+    problems = []
+    if eager:
+        problems.append('import replyify loads %s eagerly' % ', '.join(eager))
+    if elapsed > budget:
+        problems.append('import replyify took %.1fms (budget %.0fms)' % (elapsed * 1000, budget * 1000))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the replyify microbenchmarks.')
+    parser.add_argument('--update', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown against the baseline (default 0.25 = 25%%)')
+    parser.add_argument('--repeat', type=int,
+                        help='rounds per benchmark (default 15, or %d with --update; at least %d)' % (
+                            UPDATE_REPEAT, MIN_REPEAT))
+    parser.add_argument('--min-time', type=float,
+                        help='seconds per round (default 0.1, or %s with --update; at least %s)' % (
+                            UPDATE_MIN_TIME, MIN_TIME))
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('-k', dest='pattern', help='only run benchmarks whose name contains this')
+    parser.add_argument('--sizes', action='store_true', help='print request body sizes and exit')
+    parser.add_argument('--import-budget', type=float, default=0.1,
+                        help='seconds `import replyify` may take (default 0.1)')
+    args = parser.parse_args(argv)
+    if args.repeat is None:
+        args.repeat = UPDATE_REPEAT if args.update else 15
+    if args.min_time is None:
+        args.min_time = UPDATE_MIN_TIME if args.update else 0.1
+
+    if args.sizes:
+        for name, size in sorted(wire_sizes().items()):
+            print('%-28s %10d bytes' % (name, size))
+        return 0
+
+    import_problems = []
+    if not args.update and (not args.pattern or args.pattern == 'import'):
+        import_problems = check_import(args.import_budget)
+
+    funcs = dict((name, setup()) for name, setup in BENCHMARKS
+                 if not args.pattern or args.pattern in name)
+    if not funcs:
+        for problem in import_problems:
+            print(problem)
+        return 1 if import_problems else 0
+    funcs[None] = _calibrate()
+    results = measure(funcs, args.repeat, args.min_time)
+
+    if args.update:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.setdefault('benchmarks', {}).update(dict(
+            (name, round(result.value, 6)) for name, result in results.items()))
+        baseline['wire_bytes'] = wire_sizes()
+        baseline['python'] = platform.python_version()
+        baseline['replyify'] = replyify.VERSION.strip()
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        for name, result in sorted(results.items()):
+            print('%-28s %10.4f' % (name, result.value))
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)['benchmarks']
+    slower = regressions(results, baseline, args.threshold)
+    if slower:
+        # Confirm suspected regressions in a second run before failing.
+        funcs = dict((name, funcs[name]) for name in list(slower) + [None])
+        retry = measure(funcs, args.repeat, args.min_time)
+        slower = regressions(retry, baseline, args.threshold)
+        results.update(retry)
+
+    print('%-28s %10s %10s %8s %7s' % ('benchmark', 'baseline', 'current', 'change', 'noise'))
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            print('%-28s %10s %10.4f %8s' % (name, '-', result.value, 'new'))
+            continue
+        print('%-28s %10.4f %10.4f %+7.1f%% %6.1f%%%s' % (
+            name, base, result.value, (result.value / base - 1) * 100, result.noise * 100,
+            '  REGRESSION' if name in slower else ''))
+
+    if slower:
+        print('\n%d benchmark(s) regressed by more than %d%%: %s' % (
+            len(slower), args.threshold * 100, ', '.join(sorted(slower))))
+    for problem in import_problems:
+        print(problem)
+    return 1 if slower or import_problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
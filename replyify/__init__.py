@@ -4,10 +4,11 @@
 # Marco DiDomenico <marco@replyify.com>
 
 # Configuration variables
-from version import VERSION
+from replyify.version import VERSION
 __version__ = VERSION
 
 import os
+import sys
 from .utils import convert_to_boolean
 access_token = os.getenv('REPLYIFY_ACCESS_TOKEN', None)
 api_base = os.getenv('REPLYIFY_API_BASE', 'https://api.replyify.com')
@@ -15,23 +16,69 @@ upload_api_base = os.getenv('REPLYIFY_API_UPLOAD_BASE', 'https://uploads.replyif
 api_version = None
 verify_ssl_certs = convert_to_boolean(os.getenv('REPLYIFY_API_VERIFY_SSL_CERTS', True))
 default_http_client = None
+# Body encoding for POST/PUT/PATCH requests: 'form' or 'json'
+request_format = os.getenv('REPLYIFY_REQUEST_FORMAT', 'form')
+# Gzip request bodies of at least this many bytes (None disables compression)
+request_compression_threshold = None
+# Retries for connection errors and 429/5xx responses on idempotent requests
+max_network_retries = 0
+# replyify.hedging.Hedger used to hedge slow GET requests (None disables it)
+hedger = None
+# Keyword arguments for the per-host replyify.circuit_breaker.CircuitBreaker;
+# set to {} for the defaults (None disables the circuit breaker)
+circuit_breaker_settings = None
+# replyify.tenants.ClientRegistry giving each access token its own client
+client_registry = None
+# replyify.scheduler.PriorityScheduler dispatching requests by priority class
+request_scheduler = None
+# replyify.rate_limit.AdaptiveConcurrencyLimiter sizing in-flight requests
+concurrency_limiter = None
 
 
 from replyify.utils import json, logger  # noqa
 
-from replyify.resources import (  # noqa
-    Account,
-    Campaign,
-    CampaignContact,
-    Contact,
-    ContactField,
-    Note,
-    Reply,
-    Signature,
-    Tag,
-    Template,
-    Timeline,
-    TimelineItem,
-    TimelineJob,
-    Upload,
+_RESOURCES = (
+    'Account',
+    'Campaign',
+    'CampaignContact',
+    'Contact',
+    'ContactField',
+    'Note',
+    'Reply',
+    'Signature',
+    'Tag',
+    'Template',
+    'Timeline',
+    'TimelineItem',
+    'TimelineJob',
+    'Upload',
 )
+
+if sys.version_info >= (3, 7):
+    # Resources (and through them the API requestor and transports) are
+    # loaded on first attribute access to keep `import replyify` minimal.
+    def __getattr__(name):
+        if name in _RESOURCES:
+            from replyify import resources
+            return getattr(resources, name)
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+    def __dir__():
+        return sorted(list(globals()) + list(_RESOURCES))
+else:
+    from replyify.resources import (  # noqa
+        Account,
+        Campaign,
+        CampaignContact,
+        Contact,
+        ContactField,
+        Note,
+        Reply,
+        Signature,
+        Tag,
+        Template,
+        Timeline,
+        TimelineItem,
+        TimelineJob,
+        Upload,
+    )
@@ -0,0 +1,5 @@
+import sys
+
+from replyify.cli import main
+
+sys.exit(main())
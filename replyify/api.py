@@ -1,7 +1,10 @@
 import calendar
 import datetime
 import platform
+import random
+import sys
 import time
+import zlib
 
 try:
     from urllib import parse as url_parse
@@ -11,7 +14,7 @@ except Exception as e:
 # import warnings
 
 import replyify
-from replyify import exceptions, http_client, version, utils
+from replyify import circuit_breaker, exceptions, http_client, scheduler, timeouts, version, utils
 from replyify.utils import MultipartDataGenerator
 
 
@@ -24,36 +27,92 @@ def _encode_datetime(dttime):
     return int(utc_timestamp)
 
 
-def _encode_nested_dict(key, data, fmt='%s[%s]'):
-    d = {}
-    for subkey, subvalue in data.items():
-        d[fmt % (key, subkey)] = subvalue
-    return d
+_PY2 = sys.version_info < (3, 0)
+
+# Exact classes that can be emitted as-is; subclasses take the slow path so
+# that e.g. objects exposing ``replyify_guid`` keep their special handling.
+_SCALAR_TYPES = frozenset([str, bytes, int, float, bool])
 
 
 def _api_encode(data):
-    for key, value in data.items():
-        key = utils.utf8(key)
-        if value is None:
-            continue
-        elif hasattr(value, 'replyify_guid'):
-            yield (key, value.replyify_guid)
-        elif isinstance(value, list) or isinstance(value, tuple):
-            for sv in value:
+    # Depth-first walk using an explicit stack of frames instead of recursing
+    # through temporary dicts.  A frame is ``(prefix, fmt, items, is_list)``
+    # where ``items`` is a live iterator, so descending into a nested value
+    # only needs to push a new frame and resume the parent when it is done.
+    utf8 = utils.utf8 if _PY2 else None
+    scalar_types = _SCALAR_TYPES
+    stack = [(None, None, iter(data.items()), False)]
+
+    while stack:
+        prefix, fmt, items, is_list = stack[-1]
+        descended = False
+
+        if is_list:
+            list_key = '%s[]' % (prefix,)
+            for sv in items:
                 if isinstance(sv, dict):
-                    subdict = _encode_nested_dict(key, sv, fmt='%s[][%s]')
-                    for k, v in _api_encode(subdict):
-                        yield (k, v)
-                else:
-                    yield ('%s[]' % (key,), utils.utf8(sv))
-        elif isinstance(value, dict):
-            subdict = _encode_nested_dict(key, value)
-            for subkey, subvalue in _api_encode(subdict):
-                yield (subkey, subvalue)
-        elif isinstance(value, datetime.datetime):
-            yield (key, _encode_datetime(value))
+                    stack.append((prefix, '%s[][%s]', iter(sv.items()), False))
+                    descended = True
+                    break
+                yield (list_key, utf8(sv) if utf8 else sv)
         else:
-            yield (key, utils.utf8(value))
+            for key, value in items:
+                if prefix is not None:
+                    key = fmt % (prefix, key)
+                if utf8:
+                    key = utf8(key)
+
+                if value is None:
+                    continue
+                elif value.__class__ in scalar_types:
+                    yield (key, utf8(value) if utf8 else value)
+                elif hasattr(value, 'replyify_guid'):
+                    yield (key, value.replyify_guid)
+                elif isinstance(value, (list, tuple)):
+                    stack.append((key, None, iter(value), True))
+                    descended = True
+                    break
+                elif isinstance(value, dict):
+                    stack.append((key, '%s[%s]', iter(value.items()), False))
+                    descended = True
+                    break
+                elif isinstance(value, datetime.datetime):
+                    yield (key, _encode_datetime(value))
+                else:
+                    yield (key, utf8(value) if utf8 else value)
+
+        if not descended:
+            stack.pop()
+
+
+def _json_encode(value):
+    # Mirrors the semantics of _api_encode for JSON bodies: None values are
+    # dropped, objects with a guid are sent as their guid and datetimes as
+    # unix timestamps.
+    if isinstance(value, dict):
+        if hasattr(value, 'replyify_guid'):
+            return value.replyify_guid
+        return dict((k, _json_encode(v)) for k, v in value.items() if v is not None)
+    elif isinstance(value, (list, tuple)):
+        return [_json_encode(v) for v in value]
+    elif isinstance(value, datetime.datetime):
+        return _encode_datetime(value)
+    elif hasattr(value, 'replyify_guid'):
+        return value.replyify_guid
+    return value
+
+
+def _gzip_encode(data):
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+REQUEST_FORMATS = ('form', 'json')
+
+# Longest Retry-After (in seconds) honoured between retries.
+MAX_RETRY_AFTER = 60.0
 
 
 def _build_api_url(url, query):
@@ -65,18 +124,47 @@ def _build_api_url(url, query):
     return url_parse.urlunsplit((scheme, netloc, path, query, fragment))
 
 
+def _clip_timeout(timeout):
+    left = timeouts.check_deadline()
+    if left is None or timeout is None:
+        return timeout
+    connect, read = timeout
+    return min(connect, left), min(read, left)
+
+
 class ReplyifyApi(object):
 
-    def __init__(self, access_token=None, client=None, api_base=None, account=None):
+    def __init__(self, access_token=None, client=None, api_base=None, account=None,
+                 request_format=None, compression_threshold=None, hedger=None,
+                 priority=None):
         self.api_base = api_base or replyify.api_base
         self.access_token = access_token
+        self.hedger = hedger or replyify.hedger
+        self.priority = priority
+        self.last_response_headers = None
+        self.last_response_bytes = None
+        request_format = (request_format or replyify.request_format).lower()
+        if request_format not in REQUEST_FORMATS:
+            raise ValueError('Unknown request format %r, expected one of %s' % (
+                request_format, ', '.join(REQUEST_FORMATS)))
+        self.request_format = request_format
+        if compression_threshold is None:
+            compression_threshold = replyify.request_compression_threshold
+        self.compression_threshold = compression_threshold
 
         from replyify import verify_ssl_certs as verify
 
+        self._tenant = None
+        registry = replyify.client_registry
+        if client is None and replyify.default_http_client is None and registry is not None:
+            self._tenant = registry.tenant(access_token or replyify.access_token)
+            client = self._tenant.client
+
         self._client = client or replyify.default_http_client or http_client.new_default_http_client(verify_ssl_certs=verify)
 
     def request(self, method, url, params=None, headers=None):
         rbody, rcode, rheaders, my_access_token = self.request_raw(method.lower(), url, params, headers)
+        self.last_response_bytes = len(rbody) if rbody is not None else 0
         resp = self.interpret_response(rbody, rcode, rheaders)
         return resp, my_access_token
 
@@ -124,10 +212,12 @@ class ReplyifyApi(object):
 
         method = method.lower()
         abs_url = '%s%s' % (self.api_base, url)
-        encoded_params = url_parse.urlencode(list(_api_encode(params or {})))
+        content_type = None
+        content_encoding = None
 
         if method == 'get' or method == 'delete':
             if params:
+                encoded_params = url_parse.urlencode(list(_api_encode(params)))
                 abs_url = _build_api_url(abs_url, encoded_params)
             post_data = None
         elif method in ('post', 'put', 'patch', 'delete'):
@@ -137,7 +227,22 @@ class ReplyifyApi(object):
                 post_data = generator.get_post_data()
                 supplied_headers['Content-Type'] = 'multipart/form-data; boundary=%s' % (generator.boundary,)
             else:
-                post_data = encoded_params
+                if self.request_format == 'json':
+                    post_data = utils.json.dumps(_json_encode(params or {}))
+                    content_type = 'application/json'
+                else:
+                    post_data = url_parse.urlencode(list(_api_encode(params or {})))
+                    if method == 'post':
+                        content_type = 'application/x-www-form-urlencoded'
+
+                threshold = self.compression_threshold
+                if threshold is not None:
+                    # The threshold is in bytes, as sent on the wire.
+                    if not isinstance(post_data, bytes):
+                        post_data = post_data.encode('utf-8')
+                    if len(post_data) >= threshold:
+                        post_data = _gzip_encode(post_data)
+                        content_encoding = 'gzip'
         else:
             raise exceptions.APIConnectionException(
                 'Unrecognized HTTP method %r.  This may indicate a bug in the '
@@ -162,13 +267,14 @@ class ReplyifyApi(object):
         headers = {
             'X-Replyify-Client-User-Agent': utils.json.dumps(ua),
             'User-Agent': 'Replyify/v1 PythonBindings/%s' % (version.VERSION,),
-            'Authorization': 'Bearer %s' % (my_access_token,)
+            'Authorization': 'Bearer %s' % (my_access_token,),
+            'Accept-Encoding': http_client.accept_encoding(),
         }
 
-        if method == 'post':
-            headers['Content-Type'] = 'application/x-www-form-urlencoded'
-        # elif method in ('patch', 'put', 'delete'):
-        #     headers['Content-Type'] = 'application/json'
+        if content_type is not None:
+            headers['Content-Type'] = content_type
+        if content_encoding is not None:
+            headers['Content-Encoding'] = content_encoding
 
         if api_version is not None:
             headers['Replyify-Version'] = api_version
@@ -177,7 +283,7 @@ class ReplyifyApi(object):
             for key, value in list(supplied_headers.items()):
                 headers[key] = value
 
-        rbody, rcode, rheaders = self._client.request(method, abs_url, headers, post_data)
+        rbody, rcode, rheaders = self._send(method, abs_url, headers, post_data)
 
         utils.logger.info('%s %s %d', method.upper(), abs_url, rcode)
         utils.logger.debug(
@@ -186,6 +292,145 @@ class ReplyifyApi(object):
             abs_url, rcode, rbody)
         return rbody, rcode, rheaders, my_access_token
 
+    def _send(self, method, abs_url, headers, post_data):
+        max_retries = replyify.max_network_retries
+        num_retries = 0
+
+        # Thread-local settings are resolved here, since hedged attempts
+        # run on their own threads.
+        priority = self.priority or scheduler.current_priority()
+
+        while True:
+            timeout = timeouts.request_timeout(self._client)
+            try:
+                if method == 'get' and self.hedger is not None:
+                    rbody, rcode, rheaders = self.hedger.execute(
+                        timeouts.propagate(lambda: self._request_once(
+                            method, abs_url, headers, post_data, timeout, priority)),
+                        url=abs_url)
+                else:
+                    rbody, rcode, rheaders = self._request_once(
+                        method, abs_url, headers, post_data, timeout, priority)
+            except (exceptions.DeadlineExceededException, exceptions.CircuitOpenException):
+                raise
+            except exceptions.APIConnectionException:
+                if not self._should_retry(method, headers, None, num_retries, max_retries):
+                    raise
+                rcode, rheaders = None, None
+            else:
+                if not self._should_retry(method, headers, rcode, num_retries, max_retries):
+                    return rbody, rcode, rheaders
+
+            delay = self._retry_delay(num_retries, rheaders)
+            left = timeouts.remaining()
+            if left is not None and delay >= left:
+                # Sleeping would burn the rest of the budget; surface the
+                # last outcome instead of waiting for a doomed attempt.
+                if rcode is None:
+                    raise exceptions.DeadlineExceededException(
+                        'The deadline for this operation was exceeded while '
+                        'retrying a request to Replyify.')
+                return rbody, rcode, rheaders
+            num_retries += 1
+            utils.logger.info('Retrying %s %s in %.2fs (retry %d of %d)',
+                              method.upper(), abs_url, delay, num_retries, max_retries)
+            time.sleep(delay)
+
+    def _request_once(self, method, abs_url, headers, post_data, timeout, priority=None):
+        breaker = None
+        if replyify.circuit_breaker_settings is not None:
+            breaker = circuit_breaker.breaker_for(self.api_base, **replyify.circuit_breaker_settings)
+            generation = breaker.before_request()
+
+        healthy = None
+        try:
+            dispatcher = replyify.request_scheduler
+            if dispatcher is not None:
+                dispatcher.acquire(priority)
+            try:
+                timeouts.check_deadline()
+                result = self._dispatch(method, abs_url, headers, post_data, timeout)
+            finally:
+                if dispatcher is not None:
+                    dispatcher.release()
+            healthy = result[1] < 500
+            return result
+        except exceptions.DeadlineExceededException:
+            # The caller ran out of time, which says nothing about the host.
+            raise
+        except exceptions.APIConnectionException:
+            healthy = False
+            raise
+        finally:
+            if breaker is not None:
+                if healthy is None:
+                    # Any other error says nothing about the host, but a
+                    # half-open probe slot must not stay taken.
+                    breaker.release_probe(generation)
+                elif healthy:
+                    breaker.record_success(generation)
+                else:
+                    breaker.record_failure(generation)
+
+    def _dispatch(self, method, abs_url, headers, post_data, timeout):
+        limiter = replyify.concurrency_limiter
+        if limiter is not None:
+            limiter.acquire()
+        tenant = None
+        failed = True
+        try:
+            if self._tenant is not None:
+                self._tenant.acquire()
+                tenant, started = self._tenant, time.time()
+            # Queueing for a slot may have used up part or all of the deadline.
+            timeout = _clip_timeout(timeout)
+            try:
+                if timeout is None:
+                    result = self._client.request(method, abs_url, headers, post_data)
+                else:
+                    result = self._client.request(method, abs_url, headers, post_data, timeout=timeout)
+            except exceptions.APIConnectionException as e:
+                left = timeouts.remaining()
+                # A timeout cut short by the deadline is the caller's, not a
+                # host failure; socket timeouts may fire slightly early.
+                if left is not None and left < 0.01:
+                    raise exceptions.DeadlineExceededException(
+                        'The deadline for this operation was exceeded while '
+                        'waiting for Replyify: %s' % (e,))
+                raise
+            failed = False
+        finally:
+            if tenant is not None:
+                tenant.release(time.time() - started, failed)
+            if limiter is not None:
+                limiter.release()
+
+        self.last_response_headers = result[2]
+        if limiter is not None:
+            limiter.on_response(result[1], result[2])
+        return result
+
+    def _should_retry(self, method, headers, rcode, num_retries, max_retries):
+        if num_retries >= max_retries:
+            return False
+        if rcode is not None and rcode not in (429, 502, 503, 504):
+            return False
+        # Only retry requests the server can safely see twice
+        return method in ('get', 'delete', 'put') or 'Idempotency-Key' in headers
+
+    def _retry_delay(self, num_retries, rheaders):
+        retry_after = None
+        if rheaders:
+            try:
+                retry_after = float(rheaders.get('retry-after') or rheaders.get('Retry-After'))
+            except (TypeError, ValueError):
+                retry_after = None
+        if retry_after is not None and retry_after >= 0:
+            # A bogus header must not stall the caller indefinitely.
+            return min(retry_after, MAX_RETRY_AFTER)
+        delay = min(0.5 * (2 ** num_retries), 8.0)
+        return delay * (0.5 + random.random() / 2)
+
     def interpret_response(self, rbody, rcode, rheaders):
         if rcode == 204:
             return
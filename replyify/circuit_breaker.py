@@ -0,0 +1,139 @@
+import collections
+import threading
+import time
+
+from replyify import exceptions, instrumentation
+
+try:
+    _clock = time.monotonic
+except AttributeError:
+    _clock = time.time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker(object):
+    '''
+    Tracks failures (connection errors and 5xx responses) for one API host.
+
+    The breaker opens after `failure_threshold` consecutive failures, or
+    when at least `min_requests` of the last `window` requests were made
+    and their failure rate reaches `failure_rate`.  While open, calls are
+    rejected immediately with CircuitOpenException.  After `reset_timeout`
+    seconds up to `half_open_probes` probe requests are let through; a
+    successful probe closes the breaker again and a failed one reopens it.
+
+    `before_request()` returns the breaker's current generation, which
+    changes with every state transition; outcomes recorded for an older
+    generation (requests started before the breaker opened, say) are
+    ignored, so they can neither close nor reopen it.
+    '''
+
+    def __init__(self, host, failure_threshold=5, failure_rate=0.5,
+                 min_requests=20, window=50, reset_timeout=30.0,
+                 half_open_probes=1):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self._outcomes = collections.deque(maxlen=window)
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self.state == OPEN:
+                if _clock() - self._opened_at < self.reset_timeout:
+                    raise exceptions.CircuitOpenException(
+                        'Requests to %s are failing; the circuit breaker is '
+                        'open and will retry in %.0f seconds.' % (
+                            self.host, self.reset_timeout - (_clock() - self._opened_at)))
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    raise exceptions.CircuitOpenException(
+                        'Requests to %s are failing; waiting for the circuit '
+                        'breaker probe to complete.' % (self.host,))
+                self._probes += 1
+            return self._generation
+
+    def record_success(self, generation=None):
+        with self._lock:
+            if not self._current(generation):
+                return
+            self._outcomes.append(True)
+            self._consecutive_failures = 0
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED)
+
+    def release_probe(self, generation=None):
+        with self._lock:
+            if self._current(generation) and self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_failure(self, generation=None):
+        with self._lock:
+            if not self._current(generation):
+                return
+            self._outcomes.append(False)
+            self._consecutive_failures += 1
+            if self.state == HALF_OPEN:
+                self._transition(OPEN)
+            elif self.state == CLOSED and self._should_trip():
+                self._transition(OPEN)
+
+    def _current(self, generation):
+        return generation is None or generation == self._generation
+
+    def _should_trip(self):
+        if self._consecutive_failures >= self.failure_threshold:
+            return True
+        total = len(self._outcomes)
+        if total < self.min_requests:
+            return False
+        failures = total - sum(1 for ok in self._outcomes if ok)
+        return float(failures) / total >= self.failure_rate
+
+    def _transition(self, state):
+        previous, self.state = self.state, state
+        self._generation += 1
+        self._probes = 0
+        if state == OPEN:
+            self._opened_at = _clock()
+        elif state == CLOSED:
+            self._outcomes.clear()
+            self._consecutive_failures = 0
+        instrumentation.emit('circuit_breaker.state_change', host=self.host,
+                             previous=previous, state=state)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(host, **settings):
+    '''
+    The shared breaker for `host` (an `api_base`/`upload_api_base`).  The
+    settings only apply when the breaker is first created.
+    '''
+    try:
+        return _breakers[host]
+    except KeyError:
+        pass
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host, **settings)
+        return _breakers[host]
+
+
+def reset():
+    with _breakers_lock:
+        _breakers.clear()
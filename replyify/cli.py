@@ -0,0 +1,274 @@
+import argparse
+import csv
+import re
+import sys
+import tempfile
+import threading
+import time
+
+import replyify
+from replyify import resources, utils
+from replyify.journal import Journal
+from replyify.rate_limit import TokenBucket
+from replyify.utils import json
+
+COMMANDS = {
+    'export': resources.ListableAPIResource,
+    'import': resources.CreateableAPIResource,
+    'bulk-modify': resources.UpdateableAPIResource,
+    'bulk-delete': resources.DeletableAPIResource,
+}
+
+
+def _resource_name(name):
+    return re.sub(r'(?<!^)([A-Z])', r'-\1', name).lower()
+
+
+RESOURCES = dict((_resource_name(name), getattr(resources, name)) for name in replyify._RESOURCES)
+
+
+class Progress(object):
+    '''
+    Prints throughput and error counts to stderr at most every `interval`
+    seconds.
+    '''
+
+    def __init__(self, label, stream=sys.stderr, interval=0.5):
+        self.label = label
+        self.stream = stream
+        self.interval = interval
+        self.done = 0
+        self.errors = 0
+        self.skipped = 0
+        self._started = time.time()
+        self._printed = 0
+        self._lock = threading.Lock()
+
+    def update(self, error=None):
+        with self._lock:
+            self.done += 1
+            if error is not None:
+                self.errors += 1
+            now = time.time()
+            if now - self._printed >= self.interval:
+                self._printed = now
+                self._write('\r')
+
+    def finish(self):
+        self._write('\r')
+        self.stream.write('\n')
+        self.stream.flush()
+
+    def _write(self, prefix):
+        elapsed = max(time.time() - self._started, 1e-6)
+        line = '%s: %d done, %d errors' % (self.label, self.done, self.errors)
+        if self.skipped:
+            line += ', %d skipped' % self.skipped
+        line += ', %.1f/s' % (self.done / elapsed)
+        self.stream.write(prefix + line)
+        self.stream.flush()
+
+
+class _Throttle(object):
+    # A replyify.concurrency_limiter that only paces requests, so that
+    # --rate-limit also covers retries and pagination.
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def acquire(self):
+        self.bucket.acquire()
+
+    def release(self):
+        pass
+
+    def on_response(self, status, headers):
+        pass
+
+
+def _key_value(pair):
+    key, sep, value = pair.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError('expected KEY=VALUE, got %r' % pair)
+    return key, value
+
+
+def _read_rows(stream, fmt):
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield dict((k, v) for k, v in row.items() if v != '')
+    elif fmt == 'json':
+        for row in json.load(stream):
+            yield row
+    else:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+
+def _write_csv(stream, rows, fields, progress):
+    if fields:
+        writer = csv.DictWriter(stream, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict((k, _csv_value(v)) for k, v in row.items()))
+            progress.update()
+        return
+
+    # Without declared fields the header is the union of every row's keys,
+    # so rows are spooled to disk until all of them have been seen.
+    fields = []
+    seen = set()
+    with tempfile.TemporaryFile('w+') as spool:
+        for row in rows:
+            for key in row:
+                if key not in seen:
+                    seen.add(key)
+                    fields.append(key)
+            spool.write(json.dumps(row, default=str) + '\n')
+            progress.update()
+        spool.seek(0)
+        writer = csv.DictWriter(stream, fieldnames=fields)
+        writer.writeheader()
+        for line in spool:
+            writer.writerow(dict((k, _csv_value(v)) for k, v in json.loads(line).items()))
+
+
+def _write_rows(stream, fmt, rows, progress, fields=None):
+    if fmt == 'csv':
+        _write_csv(stream, rows, fields, progress)
+    elif fmt == 'json':
+        stream.write('[')
+        for i, row in enumerate(rows):
+            stream.write((',\n' if i else '\n') + json.dumps(row, default=str))
+            progress.update()
+        stream.write('\n]\n')
+    else:
+        for row in rows:
+            stream.write(json.dumps(row, default=str) + '\n')
+            progress.update()
+
+
+def _export(klass, args, progress):
+    params = dict(args.param or ())
+    if args.start is not None and args.end is not None:
+        rows = klass.sharded_iter(args.start, args.end, shards=args.shards,
+                                  max_in_flight=args.concurrency, **params)
+    else:
+        rows = klass.auto_paging_iter(**params)
+    fields = args.fields.split(',') if args.fields else None
+    _write_rows(args.output, args.format, rows, progress, fields)
+
+
+def _operation(command, klass):
+    if command == 'import':
+        return klass.create
+    if command == 'bulk-modify':
+        return klass.modify
+
+    def delete(guid, access_token=None, idempotency_key=None, **fields):
+        # Only the guid identifies the object; other columns of the input
+        # are ignored.  DELETE is idempotent, so the journal's key is not
+        # sent either.
+        return klass(guid, access_token).delete()
+    return delete
+
+
+def _write(command, klass, args, progress):
+    operation = _operation(command, klass)
+    overrides = dict(args.set or ())
+    rows = [dict(row, **overrides) for row in _read_rows(args.input, args.format)]
+
+    def call(idempotency_key=None, **row):
+        if idempotency_key is not None:
+            row['idempotency_key'] = idempotency_key
+        return operation(**row)
+
+    if args.checkpoint:
+        journal = Journal(args.checkpoint, job='%s:%s' % (command, args.resource))
+        results = journal.run(call, rows, max_workers=args.concurrency)
+    else:
+        journal = None
+        results = utils.imap_unordered(lambda row: call(**row), rows, max_workers=args.concurrency)
+
+    try:
+        for row, _, error in results:
+            if journal is not None:
+                progress.skipped = journal.skipped
+            if error is not None:
+                args.errors.write(json.dumps({'row': row, 'error': str(error)}, default=str) + '\n')
+            progress.update(error)
+    finally:
+        if journal is not None:
+            progress.skipped = journal.skipped
+            journal.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='replyify', description='Bulk operations on the Replyify API.')
+    parser.add_argument('--access-token', help='defaults to $REPLYIFY_ACCESS_TOKEN')
+    parser.add_argument('--api-base', help='defaults to $REPLYIFY_API_BASE')
+    parser.add_argument('--version', action='version', version=replyify.VERSION)
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    for command, base in sorted(COMMANDS.items()):
+        names = sorted(name for name, klass in RESOURCES.items() if issubclass(klass, base))
+        sub = commands.add_parser(command, help='%s resources' % command)
+        sub.add_argument('resource', choices=names)
+        sub.add_argument('--format', choices=('jsonl', 'json', 'csv'), default='jsonl')
+        sub.add_argument('--concurrency', type=int, default=4, help='requests in flight (default 4)')
+        sub.add_argument('--rate-limit', type=float, help='maximum requests per second')
+        sub.add_argument('--retries', type=int, default=2, help='retries per request (default 2)')
+        if command == 'export':
+            sub.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout)
+            sub.add_argument('--param', action='append', type=_key_value, metavar='KEY=VALUE', help='list filter')
+            sub.add_argument('--start', type=float, help='scan created times from this timestamp')
+            sub.add_argument('--end', type=float, help='... up to (excluding) this timestamp')
+            sub.add_argument('--shards', type=int, default=8, help='windows for --start/--end scans')
+            sub.add_argument('--fields', help='comma-separated CSV columns; streams the export '
+                                              'instead of collecting every column first')
+        else:
+            sub.add_argument('--input', type=argparse.FileType('r'), default=sys.stdin)
+            sub.add_argument('--errors', type=argparse.FileType('w'), default=sys.stderr,
+                             help='where to write failed rows as JSON lines')
+            sub.add_argument('--checkpoint', metavar='PATH',
+                             help='journal file for resuming an interrupted run')
+            if command == 'bulk-modify':
+                sub.add_argument('--set', action='append', type=_key_value, metavar='KEY=VALUE',
+                                 help='field to set on every row')
+            else:
+                sub.set_defaults(set=None)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.access_token:
+        replyify.access_token = args.access_token
+    if args.api_base:
+        replyify.api_base = args.api_base
+    replyify.max_network_retries = args.retries
+    if args.rate_limit:
+        replyify.concurrency_limiter = _Throttle(TokenBucket(args.rate_limit))
+
+    klass = RESOURCES[args.resource]
+    progress = Progress('%s %s' % (args.command, args.resource))
+    try:
+        if args.command == 'export':
+            _export(klass, args, progress)
+        else:
+            _write(args.command, klass, args, progress)
+    except KeyboardInterrupt:
+        progress.finish()
+        return 130
+    progress.finish()
+    return 1 if progress.errors else 0
+
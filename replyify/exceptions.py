@@ -44,6 +44,14 @@ class APIConnectionException(ReplyifyException):
     pass
 
 
+class DeadlineExceededException(APIConnectionException):
+    pass
+
+
+class CircuitOpenException(APIConnectionException):
+    pass
+
+
 class InvalidRequestException(ReplyifyException):
 
     def __init__(self, message, error_list, http_body=None,
@@ -0,0 +1,152 @@
+import collections
+import sys
+import threading
+import time
+
+from replyify import instrumentation
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    _clock = time.monotonic
+except AttributeError:
+    _clock = time.time
+
+
+class Hedger(object):
+    '''
+    Sends a second, identical request when an idempotent GET has not been
+    answered within `delay` seconds and returns whichever response arrives
+    first.  Without a fixed delay, the `percentile` of recently observed
+    latencies of first attempts (including those a hedge beat) is used
+    once `min_samples` requests have been seen.
+
+    `max_extra_ratio` caps the additional load: hedges are only sent while
+    they stay below that fraction of all requests (plus a small burst).
+
+    An HTTP request cannot be cancelled mid-flight, so the losing attempt
+    runs to completion in the background and holds its
+    `replyify.request_scheduler` and `replyify.concurrency_limiter` slots
+    until then; `max_extra_ratio` also bounds how many slots that takes.
+
+    Enable it for every requestor with `replyify.hedger = Hedger(...)`.
+    '''
+
+    def __init__(self, delay=None, percentile=0.95, min_samples=20,
+                 window=200, max_extra_ratio=0.05, burst=5):
+        self.delay = delay
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_extra_ratio = max_extra_ratio
+        self.burst = burst
+        self._latencies = collections.deque(maxlen=window)
+        self._tokens = float(burst)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'hedge_delay': self.hedge_delay(),
+            }
+
+    def hedge_delay(self):
+        if self.delay is not None:
+            return self.delay
+        if len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile))
+        return ordered[index]
+
+    def execute(self, send, url=None):
+        '''
+        Call `send()` (returning `(rbody, rcode, rheaders)`), hedging it with
+        a second call if the first is slow.
+        '''
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self._tokens + self.max_extra_ratio, float(self.burst))
+            delay = self.hedge_delay()
+
+        if delay is None:
+            started = _clock()
+            result = send()
+            self._record(_clock() - started)
+            return result
+
+        results = queue.Queue()
+        self._spawn(send, 0, results)
+        try:
+            return self._collect(results, delay, url)
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._tokens < 1:
+                allowed = False
+            else:
+                self._tokens -= 1
+                self.hedges += 1
+                allowed = True
+
+        if not allowed:
+            return self._collect(results, None, url, pending=1)
+
+        instrumentation.emit('hedge.sent', url=url, delay=delay)
+        self._spawn(send, 1, results)
+        return self._collect(results, None, url, pending=2)
+
+    def _spawn(self, send, attempt, results):
+        def run():
+            started = _clock()
+            try:
+                result = send()
+            except Exception:
+                results.put((attempt, None, sys.exc_info(), _clock() - started))
+                return
+            elapsed = _clock() - started
+            if attempt == 0:
+                # Recorded even when a hedge won, or slow first attempts
+                # would never show up and the percentile would drift low.
+                self._record(elapsed)
+            results.put((attempt, result, None, elapsed))
+
+        thread = threading.Thread(target=run, name='replyify-hedge-%d' % attempt)
+        thread.daemon = True
+        thread.start()
+
+    def _collect(self, results, timeout, url, pending=1):
+        # The slower attempt cannot be interrupted mid-flight; its result is
+        # simply dropped once a winner has been returned (see the class
+        # docstring for the slots it holds meanwhile).
+        error = None
+        while pending:
+            if timeout is None:
+                attempt, result, exc_info, elapsed = results.get()
+            else:
+                attempt, result, exc_info, elapsed = results.get(timeout=timeout)
+            pending -= 1
+            if exc_info is None:
+                if attempt == 1:
+                    with self._lock:
+                        self.hedge_wins += 1
+                    instrumentation.emit('hedge.won', url=url, latency=elapsed)
+                return result
+            if error is None:
+                error = exc_info
+        if sys.version_info >= (3, 0):
+            raise error[1].with_traceback(error[2])
+        raise error[1]
+
+    def _record(self, elapsed):
+        with self._lock:
+            self._latencies.append(elapsed)
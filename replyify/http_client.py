@@ -3,62 +3,186 @@
 # which is licensed The MIT License
 
 import os
+import random
+import socket
 import sys
 import textwrap
+import threading
+import time
 import warnings
-import email
+import zlib
 
-from replyify import exceptions, utils
+from replyify import exceptions, instrumentation, utils
 
 CACERT_PATH = 'data/cacert-2017-01-18.pem'
 
 
+# Transport libraries are only imported when the first client is built, so
+# that `import replyify` stays cheap for short-lived processes.
+#
 # - Requests is the preferred HTTP library
 # - Google App Engine has urlfetch
 # - Use Pycurl if it's there (at least it verifies SSL certs)
 # - Fall back to urllib2 with a warning if needed
-try:
-    import urllib.request, urllib.error, urllib.parse
-except ImportError:
-    pass
-
-try:
-    import pycurl
-except ImportError:
-    pycurl = None
-
-try:
-    import requests
-except ImportError:
-    requests = None
-else:
-    try:
-        # Require version 0.8.8, but don't want to depend on distutils
-        version = requests.__version__
-        major, minor, patch = [int(i) for i in version.split('.')]
-    except Exception:
-        # Probably some new-fangled version, so it should support verify
-        pass
-    else:
-        if (major, minor, patch) < (0, 8, 8):
-            sys.stderr.write(
-                'Warning: the Replyify library requires that your Python '
-                '"requests" library be newer than version 0.8.8, but your '
-                '"requests" library is version %s. Replyify will fall back to '
-                'an alternate HTTP library so everything should work. We '
-                'recommend upgrading your "requests" library. (HINT: running '
-                '"pip install -U requests" should upgrade your requests '
-                'library to the latest version.)' % (version,))
+urllib = None
+pycurl = None
+requests = None
+urlfetch = None
+httpx = None
+h2 = None
+brotli = None
+
+_transports_loaded = False
+_transports_lock = threading.Lock()
+
+
+def _load_transports():
+    global _transports_loaded, urllib, pycurl, requests, urlfetch, httpx, h2, brotli
+
+    if _transports_loaded:
+        return
+
+    with _transports_lock:
+        if _transports_loaded:
+            return
+
+        try:
+            import urllib.request, urllib.error, urllib.parse
+        except ImportError:
+            pass
+
+        try:
+            import pycurl
+        except ImportError:
+            pycurl = None
+
+        try:
+            import requests
+        except ImportError:
             requests = None
+        else:
+            try:
+                # Require version 0.8.8, but don't want to depend on distutils
+                version = requests.__version__
+                major, minor, patch = [int(i) for i in version.split('.')]
+            except Exception:
+                # Probably some new-fangled version, so it should support verify
+                pass
+            else:
+                if (major, minor, patch) < (0, 8, 8):
+                    sys.stderr.write(
+                        'Warning: the Replyify library requires that your Python '
+                        '"requests" library be newer than version 0.8.8, but your '
+                        '"requests" library is version %s. Replyify will fall back to '
+                        'an alternate HTTP library so everything should work. We '
+                        'recommend upgrading your "requests" library. (HINT: running '
+                        '"pip install -U requests" should upgrade your requests '
+                        'library to the latest version.)' % (version,))
+                    requests = None
+
+        try:
+            from google.appengine.api import urlfetch
+        except ImportError:
+            urlfetch = None
+
+        try:
+            import httpx
+        except ImportError:
+            httpx = None
+
+        try:
+            import h2
+        except ImportError:
+            h2 = None
+
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+
+        _transports_loaded = True
 
-try:
-    from google.appengine.api import urlfetch
-except ImportError:
-    urlfetch = None
+
+def accept_encoding():
+    _load_transports()
+    if brotli:
+        return 'gzip, deflate, br'
+    return 'gzip, deflate'
+
+
+class _DNSCache(object):
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._getaddrinfo = socket.getaddrinfo
+
+    def getaddrinfo(self, host, port, *args, **kwargs):
+        key = (host, port, args, tuple(sorted(kwargs.items())))
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        result = self._getaddrinfo(host, port, *args, **kwargs)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, result)
+        return result
+
+
+_dns_cache = None
+
+
+def install_dns_cache(ttl=300):
+    '''
+    Cache DNS lookups made through `socket.getaddrinfo` (used by requests,
+    httpx and urllib) for `ttl` seconds.  This is process-wide, so it is
+    opt-in.  pycurl keeps its own cache, see PycurlClient.
+    '''
+    global _dns_cache
+    if _dns_cache is None:
+        _dns_cache = _DNSCache(ttl)
+        socket.getaddrinfo = _dns_cache.getaddrinfo
+    else:
+        _dns_cache.ttl = ttl
+    return _dns_cache
+
+
+def uninstall_dns_cache():
+    global _dns_cache
+    if _dns_cache is not None:
+        socket.getaddrinfo = _dns_cache._getaddrinfo
+        _dns_cache = None
+
+
+def decode_content(body, content_encoding):
+    if not body or not content_encoding:
+        return body
+    encoding = content_encoding.strip().lower()
+    try:
+        if encoding in ('gzip', 'x-gzip'):
+            # Some transports decode transparently, so only inflate what
+            # still looks like a gzip stream.
+            if body[:2] == b'\x1f\x8b':
+                return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            try:
+                return zlib.decompress(body)
+            except zlib.error:
+                return zlib.decompress(body, -zlib.MAX_WBITS)
+        elif encoding == 'br' and brotli:
+            return brotli.decompress(body)
+    except Exception as e:
+        utils.logger.debug('Could not decode %s response body: %s', encoding, e)
+    return body
 
 
 def new_default_http_client(*args, **kwargs):
-    if urlfetch:
+    _load_transports()
+    http2 = kwargs.pop('http2', False)
+    if http2 and httpx:
+        impl = Http2Client
+    elif urlfetch:
         impl = UrlFetchClient
     elif requests:
         impl = RequestsClient
@@ -78,34 +202,173 @@ def new_default_http_client(*args, **kwargs):
 
 class HTTPClient(object):
 
-    def __init__(self, verify_ssl_certs=True):
+    def __init__(self, verify_ssl_certs=True, connect_timeout=30, read_timeout=80):
+        _load_transports()
         self._verify_ssl_certs = verify_ssl_certs
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
 
-    def request(self, method, url, headers, post_data=None):
+    def request(self, method, url, headers, post_data=None, timeout=None):
         raise NotImplementedError(
             'HTTPClient subclasses must implement `request`')
 
+    def _timeouts(self, timeout):
+        if timeout is None:
+            return self.connect_timeout, self.read_timeout
+        return timeout
+
+    def warm_up(self, n_connections=4, url=None):
+        '''
+        Prepare the transport for requests to `url` (the API base by
+        default): resolve (and, with install_dns_cache, cache) its address
+        and pre-open up to `n_connections` pooled connections where the
+        transport supports it.  Returns the number of connections opened.
+        '''
+        self._prime_dns(self._warm_up_url(url))
+        return 0
+
+    def _warm_up_url(self, url):
+        if url is None:
+            import replyify
+            url = replyify.api_base
+        return url
+
+    def _prime_dns(self, url):
+        parts = urllib.parse.urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        try:
+            socket.getaddrinfo(parts.hostname, port, 0, socket.SOCK_STREAM)
+        except socket.error as e:
+            utils.logger.debug('Could not resolve %s while warming up: %s', parts.hostname, e)
+
+    def _check_fork(self):
+        # Pooled connections must not be shared between a parent process
+        # and its forked children, so drop them on first use after a fork.
+        pid = os.getpid()
+        if getattr(self, '_pid', pid) != pid:
+            self._reset_after_fork()
+        self._pid = pid
+
+    def _reset_after_fork(self):
+        pass
+
+    def _decode_response(self, url, rbody, rheaders):
+        encoding = rheaders.get('content-encoding')
+        body = decode_content(rbody, encoding)
+        self._record_transfer(url, len(rbody or b''), len(body or b''), encoding)
+        return body
+
+    def _record_transfer(self, url, wire_bytes, body_bytes, encoding=None):
+        instrumentation.emit(
+            'http.response_bytes',
+            client=self.name,
+            url=url,
+            encoding=encoding or 'identity',
+            compressed_bytes=wire_bytes,
+            uncompressed_bytes=body_bytes)
+
+
+def _reject_cookies():
+    try:
+        from http import cookiejar
+    except ImportError:
+        import cookielib as cookiejar
+    return cookiejar.DefaultCookiePolicy(allowed_domains=[])
+
 
 class RequestsClient(HTTPClient):
     name = 'requests'
 
-    def request(self, method, url, headers, post_data=None):
-        kwargs = {}
+    def __init__(self, verify_ssl_certs=True, connect_timeout=30, read_timeout=80,
+                 pool_maxsize=10):
+        super(RequestsClient, self).__init__(verify_ssl_certs=verify_ssl_certs,
+                                             connect_timeout=connect_timeout,
+                                             read_timeout=read_timeout)
+        self.pool_maxsize = pool_maxsize
+        self._session = None
+        self._lock = threading.Lock()
 
+    def _verify(self):
         if self._verify_ssl_certs:
-            kwargs['verify'] = os.path.join(
-                os.path.dirname(__file__), CACERT_PATH)
+            return os.path.join(os.path.dirname(__file__), CACERT_PATH)
+        return False
+
+    def _get_session(self):
+        # Sessions keep a pool of keep-alive connections per host
+        self._check_fork()
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    # The session is shared by every access token using this
+                    # client, so cookies set for one must not be sent for
+                    # another.
+                    session.cookies.set_policy(_reject_cookies())
+                    adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.pool_maxsize)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def _reset_after_fork(self):
+        self._session = None
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def warm_up(self, n_connections=4, url=None):
+        url = self._warm_up_url(url)
+        self._prime_dns(url)
+        verify = self._verify()
+        adapter = self._get_session().get_adapter(url)
+        if hasattr(adapter, 'get_connection_with_tls_context'):
+            pool = adapter.get_connection_with_tls_context(
+                requests.Request('GET', url).prepare(), verify)
         else:
-            kwargs['verify'] = False
+            pool = adapter.get_connection(url)
+        adapter.cert_verify(pool, url, verify, None)
+
+        # Connections are opened (and TLS-handshaked) up front and handed
+        # back to the pool, where the first requests will pick them up.
+        # This relies on urllib3's private checkout API, so it is skipped
+        # on versions that lack it.
+        if not (hasattr(pool, '_get_conn') and hasattr(pool, '_put_conn')):
+            utils.logger.debug('Cannot warm up %s: unsupported urllib3 version', url)
+            return 0
+        conns = []
+        opened = 0
+        try:
+            for _ in range(min(n_connections, self.pool_maxsize)):
+                conn = pool._get_conn()
+                try:
+                    conn.connect()
+                except Exception:
+                    # Return the slot, not the broken connection.
+                    conn.close()
+                    conns.append(None)
+                    raise
+                conns.append(conn)
+                opened += 1
+        except Exception as e:
+            utils.logger.debug('Could not open connection to %s while warming up: %s', url, e)
+        finally:
+            for conn in conns:
+                pool._put_conn(conn)
+        return opened
 
+    def request(self, method, url, headers, post_data=None, timeout=None):
         try:
             try:
-                result = requests.request(method,
-                                          url,
-                                          headers=headers,
-                                          data=post_data,
-                                          timeout=80,
-                                          **kwargs)
+                result = self._get_session().request(method,
+                                                     url,
+                                                     headers=headers,
+                                                     data=post_data,
+                                                     timeout=self._timeouts(timeout),
+                                                     verify=self._verify())
             except TypeError as e:
                 raise TypeError(
                     'Warning: It looks like your installed version of the '
@@ -124,6 +387,15 @@ class RequestsClient(HTTPClient):
             # Would catch just requests.exceptions.RequestException, but can
             # also raise ValueError, RuntimeError, etc.
             self._handle_request_error(e)
+
+        # requests inflates the body itself; Content-Length still carries
+        # the size that went over the wire.
+        encoding = result.headers.get('content-encoding')
+        try:
+            wire_bytes = int(result.headers.get('content-length', len(content)))
+        except ValueError:
+            wire_bytes = len(content)
+        self._record_transfer(url, wire_bytes, len(content), encoding)
         return content, status_code, result.headers
 
     def _handle_request_error(self, e):
@@ -146,16 +418,116 @@ class RequestsClient(HTTPClient):
         raise exceptions.APIConnectionException(msg)
 
 
+class Http2Client(HTTPClient):
+    name = 'httpx'
+
+    def __init__(self, verify_ssl_certs=True, http2=True, connect_timeout=30, read_timeout=80):
+        super(Http2Client, self).__init__(verify_ssl_certs=verify_ssl_certs,
+                                          connect_timeout=connect_timeout,
+                                          read_timeout=read_timeout)
+        if httpx is None:
+            raise ImportError(
+                'Http2Client requires the "httpx" package. Install it with '
+                '"pip install replyify[http2]".')
+        if http2 and h2 is None:
+            warnings.warn(
+                'Warning: the "h2" package is not installed, so the Replyify '
+                'library will use HTTP/1.1 for the httpx client. (HINT: '
+                'running "pip install replyify[http2]" enables HTTP/2.)')
+            http2 = False
+        self._http2 = http2
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        # A single httpx.Client is shared by every thread: with HTTP/2 all
+        # concurrent requests are multiplexed over one connection per host,
+        # and servers without HTTP/2 are negotiated down to HTTP/1.1.
+        self._check_fork()
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    if self._verify_ssl_certs:
+                        import ssl
+                        verify = ssl.create_default_context(cafile=os.path.join(
+                            os.path.dirname(__file__), CACERT_PATH))
+                    else:
+                        verify = False
+                    self._client = httpx.Client(http2=self._http2, verify=verify)
+        return self._client
+
+    def request(self, method, url, headers, post_data=None, timeout=None):
+        connect_timeout, read_timeout = self._timeouts(timeout)
+        try:
+            result = self._get_client().request(
+                method.upper(), url, headers=headers, content=post_data,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+            content = result.content
+        except Exception as e:
+            self._handle_request_error(e)
+
+        self._record_transfer(url, result.num_bytes_downloaded, len(content),
+                              result.headers.get('content-encoding'))
+        return content, result.status_code, result.headers
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def warm_up(self, n_connections=4, url=None):
+        # With HTTP/2 every request shares one connection per host, so a
+        # single round trip is enough to set it up.
+        url = self._warm_up_url(url)
+        self._prime_dns(url)
+        try:
+            self._get_client().request('OPTIONS', url, timeout=httpx.Timeout(
+                self.read_timeout, connect=self.connect_timeout))
+        except Exception as e:
+            utils.logger.debug('Could not open connection to %s while warming up: %s', url, e)
+            return 0
+        return 1
+
+    def _reset_after_fork(self):
+        # Closing would shut down sockets still in use by the parent.
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _handle_request_error(self, e):
+        if isinstance(e, httpx.HTTPError):
+            msg = ("Unexpected error communicating with Replyify.  "
+                   "If this problem persists, let us know at "
+                   "support@replyify.com.")
+            err = "%s: %s" % (type(e).__name__, str(e))
+        else:
+            msg = ("Unexpected error communicating with Replyify. "
+                   "It looks like there's probably a configuration "
+                   "issue locally.  If this problem persists, let us "
+                   "know at support@replyify.com.")
+            err = "A %s was raised" % (type(e).__name__,)
+            if str(e):
+                err += " with error message %s" % (str(e),)
+            else:
+                err += " with no error message"
+        msg = textwrap.fill(msg) + "\n\n(Network error: %s)" % (err,)
+        raise exceptions.APIConnectionException(msg)
+
+
 class UrlFetchClient(HTTPClient):
     name = 'urlfetch'
 
     def __init__(self, verify_ssl_certs=True, deadline=55):
-        self._verify_ssl_certs = verify_ssl_certs
         # GAE requests time out after 60 seconds, so make sure to default
-        # to 55 seconds to allow for a slow Replyify
+        # to 55 seconds to allow for a slow Replyify.  urlfetch only takes
+        # a single deadline, which is used as the read timeout.
+        super(UrlFetchClient, self).__init__(verify_ssl_certs=verify_ssl_certs,
+                                             connect_timeout=None,
+                                             read_timeout=deadline)
         self._deadline = deadline
 
-    def request(self, method, url, headers, post_data=None):
+    def request(self, method, url, headers, post_data=None, timeout=None):
+        deadline = self._timeouts(timeout)[1] or self._deadline
         try:
             result = urlfetch.fetch(
                 url=url,
@@ -165,13 +537,15 @@ class UrlFetchClient(HTTPClient):
                 # However, that's ok because the CA bundle they use recognizes
                 # api.replyify.com.
                 validate_certificate=self._verify_ssl_certs,
-                deadline=self._deadline,
+                deadline=deadline,
                 payload=post_data
             )
         except urlfetch.Error as e:
             self._handle_request_error(e, url)
 
-        return result.content, result.status_code, result.headers
+        headers = dict((k.lower(), v) for k, v in result.headers.items())
+        content = self._decode_response(url, result.content, headers)
+        return content, result.status_code, result.headers
 
     def _handle_request_error(self, e, url):
         if isinstance(e, urlfetch.InvalidURLError):
@@ -190,20 +564,76 @@ class UrlFetchClient(HTTPClient):
                    "problem persists, let us know at support@replyify.com.")
 
         msg = textwrap.fill(msg) + "\n\n(Network error: " + str(e) + ")"
-        raise exceptions.APIConnectionError(msg)
+        raise exceptions.APIConnectionException(msg)
 
 
 class PycurlClient(HTTPClient):
     name = 'pycurl'
 
+    def __init__(self, verify_ssl_certs=True, connect_timeout=30, read_timeout=80,
+                 dns_cache_ttl=60):
+        super(PycurlClient, self).__init__(verify_ssl_certs=verify_ssl_certs,
+                                           connect_timeout=connect_timeout,
+                                           read_timeout=read_timeout)
+        self.dns_cache_ttl = dns_cache_ttl
+        self._share = None
+
+    def _get_share(self):
+        # Handles created by this client share their DNS cache, TLS
+        # sessions and, where libcurl supports it, open connections.
+        self._check_fork()
+        if self._share is None:
+            share = pycurl.CurlShare()
+            share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_DNS)
+            share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_SSL_SESSION)
+            if hasattr(pycurl, 'LOCK_DATA_CONNECT'):
+                try:
+                    share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_CONNECT)
+                except pycurl.error:
+                    pass
+            self._share = share
+        return self._share
+
+    def _reset_after_fork(self):
+        self._share = None
+
+    def warm_up(self, n_connections=4, url=None):
+        # One handshake fills the shared DNS and TLS session caches that
+        # later handles reuse.
+        url = self._warm_up_url(url)
+        curl = pycurl.Curl()
+        curl.setopt(pycurl.URL, utils.utf8(url))
+        curl.setopt(pycurl.CONNECT_ONLY, 1)
+        curl.setopt(pycurl.SHARE, self._get_share())
+        curl.setopt(pycurl.DNS_CACHE_TIMEOUT, self.dns_cache_ttl)
+        curl.setopt(pycurl.NOSIGNAL, 1)
+        if self.connect_timeout is not None:
+            curl.setopt(pycurl.CONNECTTIMEOUT_MS, int(self.connect_timeout * 1000))
+        if self._verify_ssl_certs:
+            curl.setopt(pycurl.CAINFO, os.path.join(
+                os.path.dirname(__file__), CACERT_PATH))
+        else:
+            curl.setopt(pycurl.SSL_VERIFYHOST, False)
+        try:
+            curl.perform()
+        except pycurl.error as e:
+            utils.logger.debug('Could not open connection to %s while warming up: %s', url, e)
+            return 0
+        finally:
+            curl.close()
+        return 1
+
     def parse_headers(self, data):
+        import email
+
         if '\r\n' not in data:
             return {}
         raw_headers = data.split('\r\n', 1)[1]
         headers = email.message_from_string(raw_headers)
         return dict((k.lower(), v) for k, v in dict(headers).items())
 
-    def request(self, method, url, headers, post_data=None):
+    def request(self, method, url, headers, post_data=None, timeout=None):
+        connect_timeout, read_timeout = self._timeouts(timeout)
         s = utils.StringIO.StringIO()
         rheaders = utils.StringIO.StringIO()
         curl = pycurl.Curl()
@@ -215,6 +645,8 @@ class PycurlClient(HTTPClient):
             curl.setopt(pycurl.POSTFIELDS, post_data)
         else:
             curl.setopt(pycurl.CUSTOMREQUEST, method.upper())
+            if post_data is not None:
+                curl.setopt(pycurl.POSTFIELDS, post_data)
 
         # pycurl doesn't like unicode URLs
         curl.setopt(pycurl.URL, utils.utf8(url))
@@ -222,8 +654,12 @@ class PycurlClient(HTTPClient):
         curl.setopt(pycurl.WRITEFUNCTION, s.write)
         curl.setopt(pycurl.HEADERFUNCTION, rheaders.write)
         curl.setopt(pycurl.NOSIGNAL, 1)
-        curl.setopt(pycurl.CONNECTTIMEOUT, 30)
-        curl.setopt(pycurl.TIMEOUT, 80)
+        curl.setopt(pycurl.SHARE, self._get_share())
+        curl.setopt(pycurl.DNS_CACHE_TIMEOUT, self.dns_cache_ttl)
+        if connect_timeout is not None:
+            curl.setopt(pycurl.CONNECTTIMEOUT_MS, int(connect_timeout * 1000))
+        if read_timeout is not None:
+            curl.setopt(pycurl.TIMEOUT_MS, int(read_timeout * 1000))
         curl.setopt(pycurl.HTTPHEADER, ['%s: %s' % (k, v)
                     for k, v in headers.items()])
         if self._verify_ssl_certs:
@@ -236,10 +672,11 @@ class PycurlClient(HTTPClient):
             curl.perform()
         except pycurl.error as e:
             self._handle_request_error(e)
-        rbody = s.getvalue()
         rcode = curl.getinfo(pycurl.RESPONSE_CODE)
+        lh = self.parse_headers(rheaders.getvalue())
+        rbody = self._decode_response(url, s.getvalue(), lh)
 
-        return rbody, rcode, self.parse_headers(rheaders.getvalue())
+        return rbody, rcode, lh
 
     def _handle_request_error(self, e):
         if e[0] in [pycurl.E_COULDNT_CONNECT,
@@ -261,7 +698,7 @@ class PycurlClient(HTTPClient):
                    "problem persists, let us know at support@replyify.com.")
 
         msg = textwrap.fill(msg) + "\n\n(Network error: " + e[1] + ")"
-        raise exceptions.APIConnectionError(msg)
+        raise exceptions.APIConnectionException(msg)
 
 
 class Urllib2Client(HTTPClient):
@@ -270,7 +707,9 @@ class Urllib2Client(HTTPClient):
     else:
         name = 'urllib2'
 
-    def request(self, method, url, headers, post_data=None):
+    def request(self, method, url, headers, post_data=None, timeout=None):
+        # urllib applies a single socket timeout to connecting and reading
+        read_timeout = self._timeouts(timeout)[1]
         if sys.version_info >= (3, 0) and isinstance(post_data, str):
             post_data = post_data.encode('utf-8')
 
@@ -280,7 +719,10 @@ class Urllib2Client(HTTPClient):
             req.get_method = lambda: method.upper()
 
         try:
-            response = urllib.request.urlopen(req)
+            if read_timeout is not None:
+                response = urllib.request.urlopen(req, timeout=read_timeout)
+            else:
+                response = urllib.request.urlopen(req)
             rbody = response.read()
             rcode = response.code
             headers = dict(response.info())
@@ -288,13 +730,168 @@ class Urllib2Client(HTTPClient):
             rcode = e.code
             rbody = e.read()
             headers = dict(e.info())
-        except (urllib.error.URLError, ValueError) as e:
+        except (urllib.error.URLError, ValueError, IOError) as e:
             self._handle_request_error(e)
         lh = dict((k.lower(), v) for k, v in dict(headers).items())
+        rbody = self._decode_response(url, rbody, lh)
         return rbody, rcode, lh
 
     def _handle_request_error(self, e):
         msg = ("Unexpected error communicating with Replyify. "
                "If this problem persists, let us know at support@replyify.com.")
         msg = textwrap.fill(msg) + "\n\n(Network error: " + str(e) + ")"
-        raise exceptions.APIConnectionError(msg)
+        raise exceptions.APIConnectionException(msg)
+
+
+class CannedResponseClient(HTTPClient):
+    '''
+    Offline backend returning canned responses.  `responses` maps a path
+    (e.g. '/contact/v1') or a `(method, path)` pair to a `(body, code,
+    headers)` tuple or to a callable taking `(method, url, headers,
+    post_data)`; anything else gets `default`.
+    '''
+    name = 'canned'
+
+    def __init__(self, responses=None, default=None, verify_ssl_certs=True):
+        super(CannedResponseClient, self).__init__(verify_ssl_certs=verify_ssl_certs)
+        self.responses = responses or {}
+        self.default = default or ('{"object": "list", "data": [], "has_more": false}', 200, {})
+
+    def request(self, method, url, headers, post_data=None, timeout=None):
+        path = urllib.parse.urlsplit(url).path
+        response = self.responses.get((method, path), self.responses.get(path, self.default))
+        if callable(response):
+            response = response(method, url, headers, post_data)
+        return response
+
+
+class FaultInjectionClient(HTTPClient):
+    '''
+    Wraps another HTTPClient (or a CannedResponseClient) and injects
+    latency and failures, for load tests and capacity planning:
+
+        client = FaultInjectionClient(
+            RequestsClient(), latency=('lognormal', -1.5, 0.8),
+            rate_limit_rate=0.05, reset_rate=0.01, seed=42)
+
+    `latency` is a constant number of seconds, a callable taking the RNG,
+    or one of ('uniform', low, high), ('exponential', mean) and
+    ('lognormal', mu, sigma).  The rates are per-request probabilities of
+    a 5xx error, a connection reset, a 429 with `Retry-After`, a malformed
+    JSON body or a truncated body.  With a `seed`, the same sequence of
+    requests sees the same faults, making runs reproducible.
+    '''
+
+    def __init__(self, backend, latency=None, error_rate=0.0, reset_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1, malformed_rate=0.0,
+                 truncate_rate=0.0, seed=None):
+        # Custom backends need not be HTTPClients with known timeouts.
+        super(FaultInjectionClient, self).__init__(
+            connect_timeout=getattr(backend, 'connect_timeout', None),
+            read_timeout=getattr(backend, 'read_timeout', None))
+        self.backend = backend
+        self.latency = latency
+        self.error_rate = error_rate
+        self.reset_rate = reset_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.malformed_rate = malformed_rate
+        self.truncate_rate = truncate_rate
+        self.stats = dict.fromkeys(
+            ('requests', 'errors', 'resets', 'rate_limits', 'malformed', 'truncated', 'timeouts'), 0)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.backend.name
+
+    def close(self):
+        close = getattr(self.backend, 'close', None)
+        if close is not None:
+            close()
+
+    def warm_up(self, n_connections=4, url=None):
+        warm_up = getattr(self.backend, 'warm_up', None)
+        if warm_up is None:
+            return 0
+        return warm_up(n_connections, url)
+
+    def _delay(self):
+        latency = self.latency
+        if latency is None:
+            return 0.0
+        if callable(latency):
+            return max(0.0, latency(self._random))
+        if isinstance(latency, (int, float)):
+            return float(latency)
+        kind, args = latency[0], latency[1:]
+        if kind == 'uniform':
+            return self._random.uniform(*args)
+        elif kind == 'exponential':
+            return self._random.expovariate(1.0 / args[0])
+        elif kind == 'lognormal':
+            return self._random.lognormvariate(*args)
+        raise ValueError('Unknown latency distribution %r' % (kind,))
+
+    def _plan(self):
+        # Draw every decision up front, under the lock, so that a seeded
+        # client produces the same faults for the same request sequence.
+        with self._lock:
+            self.stats['requests'] += 1
+            delay = self._delay()
+            draws = [self._random.random() for _ in range(5)]
+        fault = None
+        for name, rate, draw in zip(('reset', 'rate_limit', 'error', 'malformed', 'truncate'),
+                                    (self.reset_rate, self.rate_limit_rate, self.error_rate,
+                                     self.malformed_rate, self.truncate_rate),
+                                    draws):
+            if draw < rate:
+                fault = name
+                break
+        return delay, fault
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def request(self, method, url, headers, post_data=None, timeout=None):
+        delay, fault = self._plan()
+        read_timeout = self._timeouts(timeout)[1]
+
+        if read_timeout is not None and delay > read_timeout:
+            time.sleep(read_timeout)
+            self._count('timeouts')
+            raise exceptions.APIConnectionException(
+                'Request to %s timed out after %.2fs (injected latency %.2fs)' % (
+                    url, read_timeout, delay))
+        if delay:
+            time.sleep(delay)
+
+        if fault is not None:
+            instrumentation.emit('fault_injection.fault', url=url, fault=fault)
+        if fault == 'reset':
+            self._count('resets')
+            raise exceptions.APIConnectionException(
+                'Unexpected error communicating with Replyify.\n\n'
+                '(Network error: ConnectionResetError: connection reset by peer (injected))')
+        elif fault == 'rate_limit':
+            self._count('rate_limits')
+            return ('{"error": "Rate limit exceeded"}', 429,
+                    {'retry-after': str(self.retry_after)})
+        elif fault == 'error':
+            self._count('errors')
+            return '{"error": "Service unavailable"}', 503, {}
+
+        if timeout is None:
+            rbody, rcode, rheaders = self.backend.request(method, url, headers, post_data)
+        else:
+            rbody, rcode, rheaders = self.backend.request(method, url, headers, post_data, timeout=timeout)
+
+        if fault == 'malformed':
+            self._count('malformed')
+            rbody = '{"object": "list", "data": [{"guid": '
+        elif fault == 'truncate':
+            self._count('truncated')
+            rbody = rbody[:len(rbody) // 2]
+        return rbody, rcode, rheaders
@@ -0,0 +1,122 @@
+import threading
+import weakref
+
+from replyify import instrumentation
+
+
+class IndexedCollection(object):
+    '''
+    In-memory collection of ReplyifyObjects with hash indexes on chosen
+    fields, built in a single pass:
+
+        tags = replyify.Tag.collect(index_on=('guid', 'name'))
+        tag = tags.get('name', 'customer')
+
+    Objects are keyed by GUID.  Saves and deletes made through the bindings
+    (`save()`, `modify()`, `delete()`) keep the indexes up to date; pass
+    `watch=False` to opt out.  `normalize`, when given, is applied to
+    indexed values and lookups alike (e.g. `str.lower` for emails).
+
+    Saves and deletes may happen on other threads, so every access to the
+    indexes is serialized by a lock.
+    '''
+
+    def __init__(self, items=(), index_on=('guid',), normalize=None, watch=True):
+        self.fields = tuple(index_on)
+        self.normalize = normalize
+        self._items = {}
+        self._keys = {}
+        self._indexes = dict((field, {}) for field in self.fields)
+        self._lock = threading.RLock()
+        for item in items:
+            self.add(item)
+        self._listener = None
+        if watch:
+            self._watch()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._items.values()))
+
+    def __contains__(self, guid):
+        return guid in self._items
+
+    def _value(self, value):
+        if self.normalize is not None and value is not None:
+            return self.normalize(value)
+        return value
+
+    def add(self, item):
+        guid = item.get('guid')
+        with self._lock:
+            if guid in self._items:
+                self.remove(guid)
+            self._items[guid] = item
+            keys = {}
+            for field in self.fields:
+                value = self._value(item.get(field))
+                try:
+                    self._indexes[field].setdefault(value, []).append(guid)
+                except TypeError:
+                    # Unhashable values (nested objects, lists) are not indexed
+                    continue
+                keys[field] = value
+            self._keys[guid] = keys
+
+    def remove(self, guid):
+        with self._lock:
+            item = self._items.pop(guid, None)
+            for field, value in self._keys.pop(guid, {}).items():
+                guids = self._indexes[field].get(value)
+                if guids is not None:
+                    guids.remove(guid)
+                    if not guids:
+                        del self._indexes[field][value]
+            return item
+
+    def find(self, field, value):
+        value = self._value(value)
+        with self._lock:
+            guids = self._indexes[field].get(value, ())
+            return [self._items[guid] for guid in guids]
+
+    def get(self, field, value, default=None):
+        value = self._value(value)
+        with self._lock:
+            guids = self._indexes[field].get(value)
+            if not guids:
+                return default
+            return self._items[guids[0]]
+
+    def close(self):
+        if self._listener is not None:
+            instrumentation.unsubscribe(self._listener)
+            self._listener = None
+
+    def _watch(self):
+        # The listener only holds a weak reference, and unsubscribes itself
+        # as soon as the collection is garbage collected.
+        def listener(event, payload):
+            collection = ref()
+            if collection is not None:
+                collection._on_event(event, payload)
+
+        ref = weakref.ref(self, lambda _: instrumentation.unsubscribe(listener))
+        self._listener = instrumentation.subscribe(listener)
+
+    def _on_event(self, event, payload):
+        with self._lock:
+            if event == 'resource.saved':
+                resource = payload['resource']
+                guid = resource.get('guid')
+                current = self._items.get(guid)
+                if current is not None and type(current) is type(resource):
+                    self.add(resource)
+            elif event == 'resource.deleted':
+                guid = payload.get('guid')
+                current = self._items.get(guid)
+                if current is not None and type(current) is type(payload['resource']):
+                    self.remove(guid)
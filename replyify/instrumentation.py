@@ -0,0 +1,31 @@
+from replyify.utils import logger
+
+_listeners = []
+
+
+def subscribe(listener):
+    '''
+    Register ``listener(event, payload)`` to be called for every event
+    emitted by the bindings.  Returns the listener so it can be used as a
+    decorator.
+    '''
+    if listener not in _listeners:
+        _listeners.append(listener)
+    return listener
+
+
+def unsubscribe(listener):
+    try:
+        _listeners.remove(listener)
+    except ValueError:
+        pass
+
+
+def emit(event, **payload):
+    if not _listeners:
+        return
+    for listener in list(_listeners):
+        try:
+            listener(event, payload)
+        except Exception:
+            logger.exception('Instrumentation listener %r failed on %s', listener, event)
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import threading
+
+from replyify import utils
+from replyify.utils import json
+
+STARTED = 'started'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def _replace(src, dst):
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+        return
+    # Python 2 has no atomic replace; on Windows the target must go first.
+    if os.name == 'nt' and os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+def _default_key(item):
+    return json.dumps(item, sort_keys=True, default=str)
+
+
+class Journal(object):
+    '''
+    Records the progress of a bulk write in an append-only file so an
+    interrupted job can be restarted without re-sending finished work:
+
+        with Journal('enroll.journal', job='enroll-2022-10') as journal:
+            for item, contact, error in journal.run(replyify.Contact.create, rows):
+                ...
+
+    Every item gets an `Idempotency-Key` derived from `job` and its key
+    (`key(item)`, or the item's JSON by default), and the journal records
+    when each item starts, finishes or fails.  On restart, finished items
+    are skipped and items that were in flight or failed are sent again
+    with the same idempotency key, so the server can discard duplicates.
+
+    Dict items are passed to `func` as keyword arguments, anything else
+    positionally; `func` must accept an `idempotency_key` argument.
+    '''
+
+    def __init__(self, path, job='', sync=True):
+        self.path = path
+        self.job = job
+        self.sync = sync
+        self.skipped = 0
+        self._states = {}
+        self._lock = threading.Lock()
+        torn = self._load()
+        self._file = open(path, 'a')
+        if torn:
+            self._file.write('\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self._states)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return False
+        line = '\n'
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn final write from a crash; the item is simply
+                    # treated as not started.
+                    continue
+                self._states[entry['key']] = entry
+        return not line.endswith('\n')
+
+    def _record(self, key, state, **fields):
+        entry = dict(fields, key=key, state=state)
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            self._states[key] = entry
+            self._file.write(line)
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+
+    def state(self, key):
+        entry = self._states.get(key)
+        return entry and entry['state']
+
+    def idempotency_key(self, key):
+        text = u'%s\0%s' % (self.job, key)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def run(self, func, items, key=None, max_workers=1):
+        '''
+        Call `func` for every item not yet completed and yield
+        `(item, result, error)` in completion order.
+        '''
+        key = key or _default_key
+
+        def todo():
+            for item in items:
+                if self.state(key(item)) == DONE:
+                    self.skipped += 1
+                    continue
+                yield item
+
+        def send(item):
+            item_key = key(item)
+            idempotency_key = self.idempotency_key(item_key)
+            self._record(item_key, STARTED)
+            try:
+                if isinstance(item, dict):
+                    result = func(idempotency_key=idempotency_key, **item)
+                else:
+                    result = func(item, idempotency_key=idempotency_key)
+            except Exception as e:
+                self._record(item_key, FAILED, error=str(e))
+                raise
+            guid = result.get('guid') if hasattr(result, 'get') else None
+            self._record(item_key, DONE, guid=guid)
+            return result
+
+        if max_workers == 1:
+            for item in todo():
+                try:
+                    yield item, send(item), None
+                except Exception as e:
+                    yield item, None, e
+        else:
+            for entry in utils.imap_unordered(send, todo(), max_workers=max_workers):
+                yield entry
+
+    def compact(self):
+        '''
+        Rewrite the journal keeping only the latest entry per item.
+        '''
+        with self._lock:
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                for entry in self._states.values():
+                    f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            _replace(tmp, self.path)
+            self._file = open(self.path, 'a')
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
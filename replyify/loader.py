@@ -0,0 +1,102 @@
+from replyify import exceptions, utils
+from replyify.resources import OBJECT_CLASSES
+
+
+class RelationLoader(object):
+    '''
+    Resolves GUID references held in fields of ReplyifyObjects in batches,
+    so that walking e.g. CampaignContacts and touching each one's contact
+    costs one request per distinct contact instead of one per record:
+
+        with RelationLoader() as loader:
+            contacts = loader.load_related(campaign_contacts, 'contact')
+
+    References are deduplicated, fetched concurrently (at most
+    `max_in_flight` at a time) and memoized until the loader's scope ends.
+    References that no longer exist resolve to None.
+    '''
+
+    def __init__(self, access_token=None, max_in_flight=8):
+        self.access_token = access_token
+        self.max_in_flight = max_in_flight
+        self._cache = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.clear()
+        return False
+
+    def clear(self):
+        self._cache.clear()
+
+    def load_many(self, klass, guids):
+        '''
+        Return a dict mapping each GUID to its `klass` instance (or None).
+        '''
+        guids = list(guids)
+        wanted = []
+        seen = set()
+        for guid in guids:
+            if guid is not None and guid not in seen and (klass, guid) not in self._cache:
+                seen.add(guid)
+                wanted.append(guid)
+
+        for guid, obj, error in utils.imap_unordered(
+                lambda guid: klass.retrieve(guid, access_token=self.access_token),
+                wanted, max_workers=self.max_in_flight):
+            if error is not None:
+                if isinstance(error, exceptions.InvalidRequestException) and error.http_status == 404:
+                    obj = None
+                else:
+                    raise error
+            self._cache[(klass, guid)] = obj
+
+        return dict((guid, self._cache.get((klass, guid))) for guid in guids if guid is not None)
+
+    def load_related(self, items, field, klass=None):
+        '''
+        Resolve `item[field]` for every item and return the related objects
+        in the same order (None where an item has no reference).  The
+        resource class defaults to the one named by `field`.
+        '''
+        klass = klass or self._class_for(field)
+        items = list(items)
+        refs = [self._reference(item, field) for item in items]
+        loaded = self.load_many(klass, refs)
+        return [loaded.get(ref) if ref is not None else None for ref in refs]
+
+    def iter_related(self, iterable, field, klass=None, batch_size=100):
+        '''
+        Yield `(item, related)` pairs from `iterable` (e.g. an
+        `auto_paging_iter`), resolving references once per window of
+        `batch_size` items.
+        '''
+        batch = []
+        for item in iterable:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                for pair in zip(batch, self.load_related(batch, field, klass)):
+                    yield pair
+                batch = []
+        if batch:
+            for pair in zip(batch, self.load_related(batch, field, klass)):
+                yield pair
+
+    def _class_for(self, field):
+        name = field.replace('_', '').lower()
+        if name.endswith('guid'):
+            name = name[:-len('guid')]
+        try:
+            return OBJECT_CLASSES[name]
+        except KeyError:
+            raise ValueError(
+                'Cannot tell which resource %r refers to; pass the resource '
+                'class as `klass`.' % (field,))
+
+    def _reference(self, item, field):
+        value = item.get(field)
+        if isinstance(value, dict):
+            return value.get('guid')
+        return value
@@ -0,0 +1,40 @@
+class PageSizer(object):
+    '''
+    Chooses the `limit` of successive list requests from the latency and
+    payload size of the pages fetched so far, to page with as few requests
+    as possible without oversized responses:
+
+        for contact in replyify.Contact.auto_paging_iter(page_size=PageSizer(max_bytes=256 * 1024)):
+            ...
+
+    The page size doubles while pages come back in under half of
+    `target_latency`, shrinks in proportion when they take longer than it,
+    and never exceeds what fits in `max_bytes` at the observed bytes per
+    item.  It stays within `min_size` and `max_size` (the server's maximum
+    page size).
+    '''
+
+    def __init__(self, initial=None, min_size=10, max_size=100, target_latency=1.0,
+                 max_bytes=1024 * 1024):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.max_bytes = max_bytes
+        self.size = self._clamp(initial or min_size)
+
+    def _clamp(self, size):
+        return int(max(self.min_size, min(self.max_size, size)))
+
+    def record(self, items, seconds, nbytes=None):
+        if not items:
+            return self.size
+        if seconds > self.target_latency:
+            size = self.size * self.target_latency / seconds
+        elif seconds < self.target_latency / 2.0:
+            size = self.size * 2
+        else:
+            size = self.size
+        if nbytes and self.max_bytes:
+            size = min(size, self.max_bytes * items / float(nbytes))
+        self.size = self._clamp(size)
+        return self.size
@@ -0,0 +1,144 @@
+import threading
+import time
+
+from replyify import timeouts
+
+try:
+    _clock = time.monotonic
+except AttributeError:
+    _clock = time.time
+
+
+class TokenBucket(object):
+    '''
+    Blocking token bucket allowing `rate` requests per second on average
+    with bursts of up to `burst` requests.  Waiting for a token raises
+    DeadlineExceededException once the active deadline has passed.
+    '''
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1, rate))
+        self._tokens = self.burst
+        self._updated = _clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = _clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(timeouts.wait_timeout(wait))
+
+
+class AdaptiveConcurrencyLimiter(object):
+    '''
+    AIMD controller for the number of in-flight requests.
+
+    Every successful response grows the limit additively (by about one per
+    round of `limit` requests); a 429, or a remaining quota below
+    `low_watermark` of the reported limit, shrinks it multiplicatively by
+    `decrease_factor`, at most once per window: throttled responses to
+    requests already in flight when the limit shrank do not shrink it
+    again.  When the server says the quota is spent (429 with
+    `Retry-After`, or zero remaining with a reset time) new requests are
+    held until it resets.  A request whose deadline passes while it waits
+    raises DeadlineExceededException.
+
+    Install it with `replyify.concurrency_limiter = AdaptiveConcurrencyLimiter()`
+    to govern every request, including concurrent and bulk helpers.
+    '''
+
+    def __init__(self, initial=4, min_limit=1, max_limit=64, decrease_factor=0.5,
+                 low_watermark=0.1, remaining_header='x-ratelimit-remaining',
+                 limit_header='x-ratelimit-limit', reset_header='x-ratelimit-reset'):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.low_watermark = low_watermark
+        self.remaining_header = remaining_header
+        self.limit_header = limit_header
+        self.reset_header = reset_header
+        self.in_flight = 0
+        self._responses = 0
+        self._decrease_barrier = 0
+        self._paused_until = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._paused_until - time.time()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self._cond.wait(timeouts.wait_timeout(wait if wait > 0 else None))
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_response(self, rcode, rheaders):
+        rheaders = dict((k.lower(), v) for k, v in (rheaders or {}).items())
+        remaining = _number(rheaders.get(self.remaining_header))
+        quota = _number(rheaders.get(self.limit_header))
+        reset = _number(rheaders.get(self.reset_header))
+        retry_after = _number(rheaders.get('retry-after'))
+
+        with self._cond:
+            self._responses += 1
+            previous = int(self.limit)
+            if rcode == 429:
+                self._decrease()
+                self._pause(retry_after if retry_after is not None else reset)
+            elif remaining is not None and remaining <= 0:
+                self._decrease()
+                self._pause(reset)
+            elif remaining is not None and quota and remaining < quota * self.low_watermark:
+                self._decrease()
+            elif rcode is not None and rcode < 500:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+            current = int(self.limit)
+
+        if current != previous:
+            from replyify import instrumentation
+            instrumentation.emit('adaptive_concurrency.limit', previous=previous, limit=current,
+                                 rcode=rcode, remaining=remaining)
+
+    def _decrease(self):
+        if self._responses <= self._decrease_barrier:
+            return
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        # Requests still in flight were sent under the old limit; their
+        # responses belong to the same congestion event.
+        self._decrease_barrier = self._responses + self.in_flight
+
+    def _pause(self, seconds):
+        if seconds is None:
+            return
+        # Reset headers carry either a delay or an epoch timestamp
+        until = seconds if seconds > 1e9 else time.time() + seconds
+        self._paused_until = max(self._paused_until, until)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
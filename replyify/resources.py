@@ -2,9 +2,14 @@ try:
     from urllib.parse import quote_plus as url_quote_plus
 except ImportError:
     from urllib import quote_plus as url_quote_plus
+import datetime
+import math
 import sys
+import threading
+import time
 
-from replyify import api, exceptions, utils, upload_api_base
+from replyify import api, exceptions, instrumentation, timeouts, utils, upload_api_base
+from replyify.pagination import PageSizer
 
 
 def populate_headers(idempotency_key):
@@ -15,9 +20,19 @@ def populate_headers(idempotency_key):
 
 def _compute_diff(current, previous):
     if isinstance(current, dict):
-        previous = previous or {}
-        diff = current.copy()
-        for key in set(previous.keys()) - set(diff.keys()):
+        if not isinstance(previous, dict):
+            return current.copy()
+        diff = {}
+        for key, value in current.items():
+            if key not in previous:
+                diff[key] = value if value is not None else ''
+            elif isinstance(value, dict) and isinstance(previous[key], dict):
+                nested = _compute_diff(value, previous[key])
+                if nested:
+                    diff[key] = nested
+            elif value != previous[key]:
+                diff[key] = value if value is not None else ''
+        for key in set(previous.keys()) - set(current.keys()):
             diff[key] = ''
         return diff
     return current if current is not None else ''
@@ -38,6 +53,15 @@ def _serialize_list(array, previous):
     return params
 
 
+def _reconstruct_object(klass, values, access_token, unsaved=None, previous=None,
+                        retrieve_params=None):
+    instance = klass(None, access_token, **(retrieve_params or {}))
+    dict.update(instance, values)
+    instance._unsaved_values = set(unsaved or ())
+    instance._previous = previous if previous is not None else dict(values)
+    return instance
+
+
 class ReplyifyObject(dict):
     def __init__(self, guid=None, access_token=None, **params):
         super(ReplyifyObject, self).__init__()
@@ -89,11 +113,6 @@ class ReplyifyObject(dict):
                     k, str(self), k))
 
         super(ReplyifyObject, self).__setitem__(k, v)
-
-        # Allows for unpickling in Python 3.x
-        if not hasattr(self, '_unsaved_values'):
-            self._unsaved_values = set()
-
         self._unsaved_values.add(k)
 
     def __getitem__(self, k):
@@ -113,10 +132,19 @@ class ReplyifyObject(dict):
 
     def __delitem__(self, k):
         super(ReplyifyObject, self).__delitem__(k)
+        self._unsaved_values.add(k)
 
-        # Allows for unpickling in Python 3.x
-        if hasattr(self, '_unsaved_values'):
-            self._unsaved_values.remove(k)
+    def __reduce__(self):
+        # Clean objects only ship their data and access token; the snapshot
+        # used for diffing is rebuilt from the data when unpickling.  Pending
+        # changes keep their snapshot so a later save() sends the same diff.
+        if self._unsaved_values:
+            unsaved, previous = list(self._unsaved_values), self._previous
+        else:
+            unsaved, previous = None, None
+        return (_reconstruct_object, (
+            type(self), dict(self), self.access_token, unsaved, previous,
+            self._retrieve_params or None))
 
     @classmethod
     def construct_from(cls, values, access_token):
@@ -143,7 +171,19 @@ class ReplyifyObject(dict):
         for k, v in values.items():
             super(ReplyifyObject, self).__setitem__(k, convert_to_replyify_object(v, access_token))
 
-        self._previous = values
+        if partial and self._previous is not None:
+            previous = dict(self._previous)
+            previous.update(values)
+            self._previous = previous
+        else:
+            self._previous = values
+
+    def _mark_saved(self):
+        for v in self.values():
+            if isinstance(v, ReplyifyObject) and not isinstance(v, APIResource):
+                v._mark_saved()
+        self._unsaved_values = set()
+        self._previous = dict(self)
 
     @classmethod
     def api_base(cls):
@@ -194,13 +234,25 @@ class ReplyifyObject(dict):
                 continue
             elif isinstance(v, APIResource):
                 continue
-            elif hasattr(v, 'serialize'):
-                params[k] = v.serialize(previous.get(k, None))
             elif k in unsaved_keys:
-                params[k] = _compute_diff(v, previous.get(k, None))
+                if k in previous and not isinstance(v, dict) and v == previous[k]:
+                    continue
+                diff = _compute_diff(v, previous.get(k, None))
+                if diff != {}:
+                    params[k] = diff
+            elif hasattr(v, 'serialize'):
+                # Nested objects track their own changes against the values
+                # they were built from, so only changed leaves are sent.
+                diff = v.serialize(None)
+                if diff:
+                    params[k] = diff
             elif k == 'additional_owners' and v is not None:
                 params[k] = _serialize_list(v, previous.get(k, None))
 
+        for k in unsaved_keys - set(self.keys()):
+            if k in previous:
+                params[k] = ''
+
         return params
 
 
@@ -250,26 +302,80 @@ class APIResource(ReplyifyObject):
         return '%s/%s' % (base, extn)
 
 
+def _page_limit(sizer, max_items, limit=None):
+    if sizer is not None:
+        limit = sizer.size
+    if max_items:
+        limit = min(limit or max_items, max_items)
+    return limit
+
+
+def _list_page(access_token, api_base, url, params):
+    requestor = api.ReplyifyApi(access_token, api_base=api_base)
+    started = time.time()
+    response, access_token = requestor.request('get', url, params)
+    page = convert_to_replyify_object(response, access_token)
+    if isinstance(page, ListObject):
+        page._retrieve_params = params
+        page._fetch_stats = (time.time() - started, requestor.last_response_bytes)
+        if 'url' not in page:
+            dict.__setitem__(page, 'url', url)
+    return page
+
+
 class ListObject(ReplyifyObject):
 
     def list(self, **params):
-        return self.request('get', self['url'], params)
-
-    def auto_paging_iter(self):
+        return _list_page(self.access_token, self.api_base(), self['url'], params)
+
+    def auto_paging_iter(self, deadline=None, page_size=None, max_items=None, release=False):
+        '''
+        Yield every item of this and the following pages.
+
+        `page_size` may be a `PageSizer` (or 'auto' for a default one) to
+        tune the `limit` of each following request, and `max_items` caps
+        the page size.  Pages fetched here are emptied as their items are
+        yielded, as is this page with `release=True`, so at most one page
+        of items is held beyond what the caller keeps.
+        '''
         page = self
         params = dict(self._retrieve_params)
+        if deadline is not None and not isinstance(deadline, timeouts.Deadline):
+            deadline = timeouts.Deadline(deadline)
+        sizer = PageSizer() if page_size == 'auto' else page_size
 
         while True:
             item_guid = None
-            for item in page:
-                item_guid = item.get('guid', None)
-                yield item
+            data = page.get('data') or []
+            if sizer is not None:
+                stats = getattr(page, '_fetch_stats', None)
+                if stats is not None:
+                    sizer.record(len(data), *stats)
+            if page is self and not release:
+                for item in data:
+                    item_guid = item.get('guid', None)
+                    yield item
+            else:
+                data.reverse()
+                while data:
+                    item = data.pop()
+                    item_guid = item.get('guid', None)
+                    yield item
+                item = None
 
             if not getattr(page, 'has_more', False) or item_guid is None:
                 return
 
             params['starting_after'] = item_guid
-            page = self.list(**params)
+            limit = _page_limit(sizer, max_items, params.get('limit'))
+            if limit is not None:
+                params['limit'] = limit
+            page = None
+            if deadline is None:
+                page = self.list(**params)
+            else:
+                with deadline:
+                    page = self.list(**params)
 
     def create(self, idempotency_key=None, **params):
         headers = populate_headers(idempotency_key)
@@ -308,15 +414,129 @@ class SingletonAPIResource(APIResource):
 class ListableAPIResource(APIResource):
 
     @classmethod
-    def auto_paging_iter(self, *args, **params):
-        return self.list(*args, **params).auto_paging_iter()
+    def auto_paging_iter(cls, *args, **params):
+        # `deadline` (seconds or a timeouts.Deadline) bounds the whole run;
+        # `page_size` and `max_items` are passed to ListObject.auto_paging_iter
+        deadline = params.pop('deadline', None)
+        max_items = params.pop('max_items', None)
+        sizer = params.pop('page_size', None)
+        if sizer == 'auto':
+            sizer = PageSizer(initial=params.get('limit'))
+        limit = _page_limit(sizer, max_items, params.get('limit'))
+        if limit is not None:
+            params['limit'] = limit
+
+        if deadline is not None and not isinstance(deadline, timeouts.Deadline):
+            deadline = timeouts.Deadline(deadline)
+        if deadline is None:
+            page = cls.list(*args, **params)
+        else:
+            with deadline:
+                page = cls.list(*args, **params)
+        return page.auto_paging_iter(deadline=deadline, page_size=sizer,
+                                     max_items=max_items, release=True)
+
+    @classmethod
+    def sharded_iter(cls, start, end, shards=8, max_in_flight=None, field='created',
+                     lower_param='%s__gte', upper_param='%s__lt', deadline=None,
+                     buffer_size=1000, **params):
+        '''
+        Page through `[start, end)` of `field` (timestamps or datetimes) as
+        `shards` disjoint windows, fetching up to `max_in_flight` windows
+        concurrently.  Each window is filtered with the `lower_param` and
+        `upper_param` list filters and paged with `auto_paging_iter`, and
+        items are yielded as they arrive.  Windows are half-open, so no item
+        belongs to two of them; within a window items are deduplicated by
+        GUID until the window is finished, so each one is delivered exactly
+        once while memory stays bounded by the largest window.
+        '''
+        try:
+            import queue
+        except ImportError:
+            import Queue as queue
+
+        windows = queue.Queue()
+        for window in _shard_windows(start, end, shards):
+            windows.put(window)
+        if deadline is not None and not isinstance(deadline, timeouts.Deadline):
+            deadline = timeouts.Deadline(deadline)
+
+        results = queue.Queue(maxsize=buffer_size)
+        stop = threading.Event()
+        done = object()
+        window_done = object()
+
+        def put(entry):
+            while not stop.is_set():
+                try:
+                    results.put(entry, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker():
+            try:
+                while not stop.is_set():
+                    try:
+                        lower, upper = windows.get_nowait()
+                    except queue.Empty:
+                        break
+                    shard_params = dict(params)
+                    shard_params[lower_param % (field,)] = lower
+                    shard_params[upper_param % (field,)] = upper
+                    for item in cls.auto_paging_iter(deadline=deadline, **shard_params):
+                        if not put((lower, item, None)):
+                            return
+                    if not put((lower, window_done, None)):
+                        return
+            except Exception as e:
+                put((None, None, e))
+            finally:
+                put((None, done, None))
+
+        workers = max(1, min(shards, max_in_flight or shards))
+        for _ in range(workers):
+            thread = threading.Thread(target=worker, name='replyify-shard')
+            thread.daemon = True
+            thread.start()
+
+        seen = {}
+        running = workers
+        try:
+            while running:
+                window, item, error = results.get()
+                if error is not None:
+                    raise error
+                if item is done:
+                    running -= 1
+                    continue
+                if item is window_done:
+                    seen.pop(window, None)
+                    continue
+                guid = item.get('guid')
+                if guid is not None:
+                    guids = seen.setdefault(window, set())
+                    if guid in guids:
+                        continue
+                    guids.add(guid)
+                yield item
+        finally:
+            stop.set()
+
+    @classmethod
+    def collect(cls, index_on=('guid',), normalize=None, **params):
+        '''
+        Fetch every page into an IndexedCollection with hash indexes on the
+        `index_on` fields.
+        '''
+        from replyify.indexes import IndexedCollection
+        return IndexedCollection(cls.auto_paging_iter(**params),
+                                 index_on=index_on, normalize=normalize)
 
     @classmethod
     def list(cls, access_token=None, idempotency_key=None, **params):
-        requestor = api.ReplyifyApi(access_token, api_base=cls.api_base())
-        url = cls.class_url()
-        response, access_token = requestor.request('get', url, params)
-        return convert_to_replyify_object(response, access_token)
+        return _list_page(access_token, cls.api_base(), cls.class_url(), params)
 
 
 class CreateableAPIResource(APIResource):
@@ -337,7 +557,9 @@ class UpdateableAPIResource(APIResource):
         requestor = api.ReplyifyApi(access_token)
         headers = populate_headers(idempotency_key)
         response, access_token = requestor.request('patch', url, params, headers)
-        return convert_to_replyify_object(response, access_token)
+        obj = convert_to_replyify_object(response, access_token)
+        instrumentation.emit('resource.saved', resource=obj)
+        return obj
 
     @classmethod
     def modify(cls, guid, **params):
@@ -349,7 +571,10 @@ class UpdateableAPIResource(APIResource):
         headers = populate_headers(idempotency_key)
 
         if updated_params:
-            self.refresh_from(self.request('post', self.instance_url(), updated_params, headers))
+            response = self.request('patch', self.instance_url(), updated_params, headers)
+            self._mark_saved()
+            self.refresh_from(response, partial=True)
+            instrumentation.emit('resource.saved', resource=self)
         else:
             utils.logger.debug('Trying to save already saved object %r', self)
         return self
@@ -358,10 +583,103 @@ class UpdateableAPIResource(APIResource):
 class DeletableAPIResource(APIResource):
 
     def delete(self, **params):
+        guid = self.get('guid')
         self.refresh_from(self.request('delete', self.instance_url(), params))
+        instrumentation.emit('resource.deleted', resource=self, guid=guid)
         return self
 
 
+class AwaitableAPIResource(APIResource):
+    '''
+    Resources the server finishes asynchronously.  They are complete once
+    their `status_field` holds one of `complete_statuses`; a missing or
+    unknown status counts as still pending.  Subclasses override both to
+    match their payload.
+    '''
+
+    status_field = 'status'
+    complete_statuses = frozenset(['complete', 'completed', 'done', 'succeeded', 'success',
+                                   'failed', 'error', 'cancelled', 'canceled'])
+
+    def is_complete(self):
+        status = self.get(self.status_field)
+        return hasattr(status, 'lower') and status.lower() in self.complete_statuses
+
+    def wait(self, timeout=None, poll_interval=1.0, max_interval=30.0, backoff=1.5):
+        for job in self.wait_all([self], timeout=timeout, poll_interval=poll_interval,
+                                 max_interval=max_interval, backoff=backoff):
+            return job
+
+    @classmethod
+    def wait_all(cls, jobs, timeout=None, poll_interval=1.0, max_interval=30.0,
+                 backoff=1.5, max_in_flight=4, batch_size=100):
+        '''
+        Yield each job as soon as it completes.
+
+        Every round first lists the most recent `batch_size` jobs of each
+        type, which settles any pending job found on that page with a single
+        request, and only retrieves the remaining jobs individually with at
+        most `max_in_flight` requests outstanding.  The delay between rounds
+        starts at `poll_interval` and grows by `backoff` (up to
+        `max_interval`) while nothing completes.  Raises
+        DeadlineExceededException if jobs are still pending after `timeout`
+        seconds.
+        '''
+        deadline = timeouts.Deadline(timeout) if timeout is not None else None
+        pending = dict((job.get('guid'), job) for job in jobs)
+        interval = poll_interval
+
+        for guid, job in list(pending.items()):
+            if job.is_complete():
+                del pending[guid]
+                yield job
+
+        while pending:
+            delay, last_round = interval, False
+            if deadline is not None:
+                left = deadline.remaining()
+                if left <= interval:
+                    # Spend what is left of the budget and poll once more.
+                    delay, last_round = max(left, 0), True
+            time.sleep(delay)
+
+            completed = []
+            unseen = dict(pending)
+            groups = {}
+            for job in pending.values():
+                groups.setdefault((type(job), job.access_token), []).append(job)
+            for (klass, access_token), group in groups.items():
+                if len(group) < 2 or not issubclass(klass, ListableAPIResource):
+                    continue
+                try:
+                    page = klass.list(access_token=access_token, limit=batch_size)
+                except exceptions.ReplyifyException as e:
+                    utils.logger.debug('Could not list %s jobs: %s', klass.__name__, e)
+                    continue
+                for item in page:
+                    job = unseen.pop(item.get('guid'), None)
+                    if job is not None:
+                        job.refresh_from(item)
+
+            for job, _, error in utils.imap_unordered(lambda job: job.refresh(), list(unseen.values()),
+                                                      max_workers=max_in_flight):
+                if error is not None:
+                    raise error
+
+            for guid, job in list(pending.items()):
+                if job.is_complete():
+                    del pending[guid]
+                    completed.append(job)
+
+            for job in completed:
+                yield job
+            if last_round and pending:
+                raise exceptions.DeadlineExceededException(
+                    'Timed out waiting for %d job(s) to complete: %s' % (
+                        len(pending), ', '.join(sorted(pending))))
+            interval = poll_interval if completed else min(interval * backoff, max_interval)
+
+
 # API objects
 class Account(CreateableAPIResource, UpdateableAPIResource):
     @classmethod
@@ -515,7 +833,7 @@ class TimelineItem(CreateableAPIResource, UpdateableAPIResource, ListableAPIReso
         return cls._modify(cls._build_instance_url(guid), **params)
 
 
-class TimelineJob(CreateableAPIResource, UpdateableAPIResource, ListableAPIResource):
+class TimelineJob(CreateableAPIResource, UpdateableAPIResource, ListableAPIResource, AwaitableAPIResource):
     @classmethod
     def class_url(cls):
         return '/timeline-job/v1'
@@ -544,7 +862,7 @@ class Signature(CreateableAPIResource, UpdateableAPIResource, ListableAPIResourc
         return cls._modify(cls._build_instance_url(guid), **params)
 
 
-class Upload(CreateableAPIResource, ListableAPIResource):
+class Upload(CreateableAPIResource, ListableAPIResource, AwaitableAPIResource):
 
     @classmethod
     def retrieve(cls, guid=None, access_token=None, **params):
@@ -553,25 +871,45 @@ class Upload(CreateableAPIResource, ListableAPIResource):
         return instance
 
 
+OBJECT_CLASSES = {
+    'account': Account,
+    'campaign': Campaign,
+    'campaigncontact': CampaignContact,
+    'contact': Contact,
+    'contactfield': ContactField,
+    'note': Note,
+    'reply': Reply,
+    'signature': Signature,
+    'tag': Tag,
+    'template': Template,
+    'timeline': Timeline,
+    'timelineitem': TimelineItem,
+    'timelinejob': TimelineJob,
+    'upload': Upload,
+    'list': ListObject,
+    # 'link': Link,
+    # 'link_click': LinkClick,
+}
+
+
+def _timestamp(value):
+    if isinstance(value, datetime.datetime):
+        return api._encode_datetime(value)
+    return value
+
+
+def _shard_windows(start, end, shards):
+    # Whole-second, half-open windows that exactly tile [start, end); the
+    # API's time filters do not accept fractional timestamps.
+    start = int(math.floor(_timestamp(start)))
+    end = int(math.ceil(_timestamp(end)))
+    shards = max(1, min(shards, end - start))
+    bounds = [start + i * (end - start) // shards for i in range(shards)] + [end]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
 def convert_to_replyify_object(resp, access_token):
-    types = {
-        'account': Account,
-        'campaign': Campaign,
-        'campaigncontact': CampaignContact,
-        'contact': Contact,
-        'contactfield': ContactField,
-        'note': Note,
-        'reply': Reply,
-        'signature': Signature,
-        'tag': Tag,
-        'template': Template,
-        'timeline': Timeline,
-        'timelineitem': TimelineItem,
-        'timelinejob': TimelineJob,
-        'upload': Upload,
-        # 'link': Link,
-        # 'link_click': LinkClick,
-    }
+    types = OBJECT_CLASSES
 
     if isinstance(resp, list):
         return [convert_to_replyify_object(i, access_token) for i in resp]
@@ -0,0 +1,109 @@
+import itertools
+import threading
+import time
+
+from replyify import timeouts
+from replyify.rate_limit import TokenBucket
+
+try:
+    _clock = time.monotonic
+except AttributeError:
+    _clock = time.time
+
+HIGH = 'high'
+NORMAL = 'normal'
+LOW = 'low'
+
+_LEVELS = {HIGH: 0, NORMAL: 1, LOW: 2}
+
+_local = threading.local()
+
+
+class priority(object):
+    '''
+    Context manager setting the priority class of requests issued by the
+    current thread:
+
+        with replyify.scheduler.priority(replyify.scheduler.HIGH):
+            reply = replyify.Reply.retrieve(guid)
+    '''
+
+    def __init__(self, level):
+        if level not in _LEVELS:
+            raise ValueError('Unknown priority %r, expected one of %s' % (
+                level, ', '.join(sorted(_LEVELS))))
+        self.level = level
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self.level)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.stack.pop()
+        return False
+
+
+def current_priority():
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else NORMAL
+
+
+class PriorityScheduler(object):
+    '''
+    Dispatches requests by priority class within a shared concurrency limit
+    and optional rate limit (requests per second).
+
+    Waiting requests are promoted by one class for every `aging` seconds
+    they have waited, so background work still makes progress while a
+    steady stream of interactive calls is being served.  A request never
+    waits past the active deadline (see `replyify.timeouts.Deadline`);
+    it raises DeadlineExceededException instead.
+
+    Install it with `replyify.request_scheduler = PriorityScheduler(...)`.
+    '''
+
+    def __init__(self, max_concurrency=10, rate_limit=None, burst=None, aging=5.0):
+        self.max_concurrency = max_concurrency
+        self.aging = aging
+        self._bucket = TokenBucket(rate_limit, burst) if rate_limit else None
+        self._in_flight = 0
+        self._waiting = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def _rank(self, entry, now):
+        level, seq, enqueued_at = entry
+        if self.aging:
+            level -= int((now - enqueued_at) / self.aging)
+        return (level, seq)
+
+    def _head(self):
+        now = _clock()
+        return min(self._waiting, key=lambda entry: self._rank(entry, now))
+
+    def acquire(self, level=None):
+        entry = (_LEVELS[level or current_priority()], next(self._counter), _clock())
+        with self._cond:
+            self._waiting.append(entry)
+            try:
+                while True:
+                    if self._in_flight < self.max_concurrency and self._head() is entry:
+                        wait = self._bucket.try_acquire() if self._bucket else 0
+                        if not wait:
+                            self._in_flight += 1
+                            return
+                    else:
+                        # Re-rank periodically so aging can promote us
+                        wait = self.aging or None
+                    self._cond.wait(timeouts.wait_timeout(wait))
+            finally:
+                self._waiting.remove(entry)
+                self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
@@ -0,0 +1,169 @@
+import collections
+import threading
+import time
+
+from replyify import http_client
+from replyify.rate_limit import TokenBucket
+
+try:
+    _clock = time.monotonic
+except AttributeError:
+    _clock = time.time
+
+
+class FairScheduler(object):
+    '''
+    Shares `max_concurrency` in-flight requests between tenants.  When all
+    slots are busy, waiting tenants are served round-robin, so a tenant with
+    a large backlog only ever holds its turn and cannot starve the others.
+    '''
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self._in_flight = 0
+        self._waiters = {}
+        self._turns = collections.deque()
+        self._cond = threading.Condition()
+
+    def acquire(self, key):
+        with self._cond:
+            if self._in_flight < self.max_concurrency and not self._turns:
+                self._in_flight += 1
+                return
+            ticket = [False]
+            queue = self._waiters.setdefault(key, collections.deque())
+            queue.append(ticket)
+            if key not in self._turns:
+                self._turns.append(key)
+            while not ticket[0]:
+                self._cond.wait()
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            while self._turns and self._in_flight < self.max_concurrency:
+                key = self._turns.popleft()
+                queue = self._waiters[key]
+                ticket = queue.popleft()
+                if queue:
+                    self._turns.append(key)
+                else:
+                    del self._waiters[key]
+                ticket[0] = True
+                self._in_flight += 1
+            self._cond.notify_all()
+
+
+class Tenant(object):
+    '''
+    Per-access-token state: a dedicated HTTP client (and so connection
+    pool), an optional rate limiter and request metrics.
+    '''
+
+    def __init__(self, access_token, client, scheduler=None, rate_limiter=None):
+        self.access_token = access_token
+        self.client = client
+        self.scheduler = scheduler
+        self.rate_limiter = rate_limiter
+        self.in_flight = 0
+        self.last_used = _clock()
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        if self.scheduler is not None:
+            self.scheduler.acquire(self.access_token)
+        with self._lock:
+            self.in_flight += 1
+            self.last_used = _clock()
+
+    def release(self, latency, failed=False):
+        with self._lock:
+            self.in_flight -= 1
+            self.requests += 1
+            self.total_latency += latency
+            if failed:
+                self.errors += 1
+            self.last_used = _clock()
+        if self.scheduler is not None:
+            self.scheduler.release()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'in_flight': self.in_flight,
+                'mean_latency': self.total_latency / self.requests if self.requests else None,
+            }
+
+    def close(self):
+        close = getattr(self.client, 'close', None)
+        if close is not None:
+            close()
+
+
+class ClientRegistry(object):
+    '''
+    Keeps one Tenant per access token, evicting the least recently used
+    idle tenants beyond `max_tenants`.  Tenants with requests in flight
+    are never evicted, so the registry may briefly hold more than
+    `max_tenants` when all of them are busy.  All tenants share a FairScheduler
+    limiting the global concurrency to `max_concurrency` requests.
+
+    Install it with `replyify.client_registry = ClientRegistry(...)` and
+    every ReplyifyApi built for a token will use that token's tenant.
+    '''
+
+    def __init__(self, max_tenants=100, max_concurrency=10, rate_limit=None,
+                 rate_limit_burst=None, client_factory=None):
+        self.max_tenants = max_tenants
+        self.scheduler = FairScheduler(max_concurrency) if max_concurrency else None
+        self.rate_limit = rate_limit
+        self.rate_limit_burst = rate_limit_burst
+        self.client_factory = client_factory
+        self._tenants = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def tenant(self, access_token):
+        with self._lock:
+            tenant = self._tenants.pop(access_token, None)
+            if tenant is None:
+                tenant = self._create(access_token)
+            self._tenants[access_token] = tenant
+            evicted = self._evict(access_token)
+
+        for old in evicted:
+            old.close()
+        return tenant
+
+    def metrics(self):
+        with self._lock:
+            tenants = list(self._tenants.values())
+        return dict((t.access_token, t.metrics()) for t in tenants)
+
+    def _create(self, access_token):
+        if self.client_factory is not None:
+            client = self.client_factory()
+        else:
+            from replyify import verify_ssl_certs
+            client = http_client.new_default_http_client(verify_ssl_certs=verify_ssl_certs)
+        rate_limiter = None
+        if self.rate_limit:
+            rate_limiter = TokenBucket(self.rate_limit, self.rate_limit_burst)
+        return Tenant(access_token, client, self.scheduler, rate_limiter)
+
+    def _evict(self, keep):
+        evicted = []
+        if len(self._tenants) <= self.max_tenants:
+            return evicted
+        for key in list(self._tenants):
+            if len(self._tenants) <= self.max_tenants:
+                break
+            if key != keep and self._tenants[key].in_flight == 0:
+                evicted.append(self._tenants.pop(key))
+        return evicted
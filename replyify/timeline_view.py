@@ -0,0 +1,155 @@
+import collections
+import itertools
+import threading
+import time
+
+from replyify import utils
+from replyify.resources import Note, Reply, Timeline, TimelineItem
+
+DEFAULT_SOURCES = (
+    (Timeline, 'contact'),
+    (TimelineItem, 'contact'),
+    (Note, 'contact'),
+    (Reply, 'contact'),
+)
+
+
+def _sort_key(item):
+    # Items without a creation time sort first; neither the timestamps nor
+    # the GUIDs are ever compared against a placeholder of another type.
+    created = item.get('created')
+    return (created is not None, created, item.get('guid') or '')
+
+
+class _ContactTimeline(object):
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self.items = []
+        self.keys = set()
+        self.newest = {}
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+
+    def add(self, items):
+        new = []
+        for item in items:
+            key = _sort_key(item)
+            if key not in self.keys:
+                self.keys.add(key)
+                new.append(item)
+        if not new:
+            return
+        new.sort(key=_sort_key)
+        if self.items and _sort_key(new[0]) < _sort_key(self.items[-1]):
+            # Both runs are sorted, so this sort is a linear merge.
+            self.items.extend(new)
+            self.items.sort(key=_sort_key)
+        else:
+            self.items.extend(new)
+        overflow = len(self.items) - self.max_items
+        if self.max_items and overflow > 0:
+            for item in self.items[:overflow]:
+                self.keys.discard(_sort_key(item))
+            del self.items[:overflow]
+
+
+class TimelineView(object):
+    '''
+    A materialized, time-ordered view of each contact's activity, merged
+    from the `Timeline`, `TimelineItem`, `Note` and `Reply` listings:
+
+        view = TimelineView(max_contacts=500)
+        items = view.get(contact_guid, limit=50)
+
+    The first `get()` for a contact pages through every source; later
+    calls only fetch items newer than the newest one seen per source
+    (using `ending_before`), at most once per `refresh_interval` seconds.
+    Items are returned newest first.  Up to `max_contacts` timelines are
+    kept, evicting the least recently used, each holding at most the
+    newest `max_items` items.
+
+    Deleted or edited items are not picked up by incremental refreshes;
+    call `invalidate()` to rebuild a contact's timeline from scratch.
+    '''
+
+    def __init__(self, access_token=None, max_contacts=1000, max_items=1000, refresh_interval=0,
+                 sources=DEFAULT_SOURCES, page_size=100, max_in_flight=4):
+        self.access_token = access_token
+        self.max_contacts = max_contacts
+        self.max_items = max_items
+        self.refresh_interval = refresh_interval
+        self.sources = sources
+        self.page_size = page_size
+        self.max_in_flight = max_in_flight
+        self._timelines = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._timelines)
+
+    def __contains__(self, contact):
+        return contact in self._timelines
+
+    def get(self, contact, limit=None, refresh=True):
+        timeline = self._timeline(contact)
+        with timeline.lock:
+            stale = (timeline.refreshed_at is None or
+                     time.time() - timeline.refreshed_at >= self.refresh_interval)
+            if timeline.refreshed_at is None or (refresh and stale):
+                self._refresh(contact, timeline)
+            items = timeline.items[-limit:] if limit else timeline.items[:]
+        items.reverse()
+        return items
+
+    def invalidate(self, contact):
+        with self._lock:
+            self._timelines.pop(contact, None)
+
+    def clear(self):
+        with self._lock:
+            self._timelines.clear()
+
+    def _timeline(self, contact):
+        with self._lock:
+            timeline = self._timelines.pop(contact, None)
+            if timeline is None:
+                timeline = _ContactTimeline(self.max_items)
+            self._timelines[contact] = timeline
+            while len(self._timelines) > self.max_contacts:
+                self._timelines.popitem(last=False)
+            return timeline
+
+    def _refresh(self, contact, timeline):
+        def fetch(source):
+            klass, field = source
+            params = {field: contact, 'limit': self.page_size}
+            newest = timeline.newest.get(klass)
+            if newest is None:
+                # Listings are newest first, so only the items that can be
+                # kept are fetched.
+                items = klass.auto_paging_iter(access_token=self.access_token, **params)
+                return list(itertools.islice(items, self.max_items or None))
+
+            items = []
+            while True:
+                page = klass.list(access_token=self.access_token, ending_before=newest, **params)
+                data = getattr(page, 'data', [])
+                items.extend(data)
+                if not data or not getattr(page, 'has_more', False):
+                    return items
+                newest = data[0].get('guid')
+
+        failure = None
+        fetched = []
+        for (klass, _), items, error in utils.imap_unordered(fetch, self.sources,
+                                                             max_workers=self.max_in_flight):
+            if error is not None:
+                failure = error
+            elif items:
+                fetched.extend(items)
+                timeline.newest[klass] = max(items, key=_sort_key).get('guid')
+        timeline.add(fetched)
+        if failure is not None:
+            raise failure
+        timeline.refreshed_at = time.time()
@@ -0,0 +1,146 @@
+import threading
+import time
+
+from replyify import exceptions
+
+try:
+    _clock = time.monotonic
+except AttributeError:
+    _clock = time.time
+
+_local = threading.local()
+
+
+def _stack(name):
+    stack = getattr(_local, name, None)
+    if stack is None:
+        stack = []
+        setattr(_local, name, stack)
+    return stack
+
+
+class Deadline(object):
+    '''
+    Time budget shared by every request issued while it is active, e.g.
+    a whole `auto_paging_iter` run or a sequence of retries:
+
+        with replyify.timeouts.Deadline(10):
+            for contact in replyify.Contact.auto_paging_iter():
+                ...
+
+    The budget starts counting when the deadline is created, so the same
+    instance can be entered several times.  Nested deadlines never extend
+    the budget of an enclosing one.
+    '''
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = _clock() + seconds
+
+    def remaining(self):
+        return self.expires_at - _clock()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def __enter__(self):
+        _stack('deadlines').append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _stack('deadlines').remove(self)
+        return False
+
+
+class Timeout(object):
+    '''
+    Per-call connect/read timeouts (in seconds) for requests issued in the
+    block, overriding the defaults of the HTTP client.
+    '''
+
+    def __init__(self, connect=None, read=None):
+        self.connect = connect
+        self.read = read
+
+    def __enter__(self):
+        _stack('timeouts').append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _stack('timeouts').pop()
+        return False
+
+
+def remaining():
+    '''
+    Seconds left in the tightest active deadline, or None without one.
+    '''
+    deadlines = getattr(_local, 'deadlines', None)
+    if not deadlines:
+        return None
+    return min(d.remaining() for d in deadlines)
+
+
+def check_deadline():
+    left = remaining()
+    if left is not None and left <= 0:
+        raise exceptions.DeadlineExceededException(
+            'The deadline for this operation was exceeded before the request '
+            'to Replyify could be completed.')
+    return left
+
+
+def wait_timeout(wait=None):
+    '''
+    How long a blocking wait of `wait` seconds (None for no limit) may
+    last under the tightest active deadline.  Raises
+    DeadlineExceededException once that deadline has passed.
+    '''
+    left = check_deadline()
+    if left is None:
+        return wait
+    return left if wait is None else min(wait, left)
+
+
+def propagate(func):
+    '''
+    Wrap `func` to run under the deadlines active in the calling thread,
+    for work handed off to another thread.
+    '''
+    deadlines = list(getattr(_local, 'deadlines', ()))
+
+    def run(*args, **kwargs):
+        stack = _stack('deadlines')
+        saved = stack[:]
+        stack[:] = deadlines
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stack[:] = saved
+    return run
+
+
+def request_timeout(client):
+    '''
+    The (connect, read) timeout for the next request made with `client`, or
+    None when neither a per-call timeout nor a deadline is active and the
+    client defaults apply.
+    '''
+    left = check_deadline()
+    overrides = getattr(_local, 'timeouts', None)
+    if left is None and not overrides:
+        return None
+
+    connect = getattr(client, 'connect_timeout', None)
+    read = getattr(client, 'read_timeout', None)
+    if overrides:
+        override = overrides[-1]
+        if override.connect is not None:
+            connect = override.connect
+        if override.read is not None:
+            read = override.read
+
+    if left is not None:
+        connect = left if connect is None else min(connect, left)
+        read = left if read is None else min(read, left)
+    return connect, read
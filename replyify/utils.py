@@ -3,6 +3,7 @@ import sys
 import os
 import random
 import io
+import threading
 
 logger = logging.getLogger('replyify')
 
@@ -58,13 +59,56 @@ def convert_to_boolean(s):
     return False
 
 
-def utf8(value):
-    if isinstance(value, str) and sys.version_info < (3, 0):
-        return value.encode('utf-8')
-    else:
+if sys.version_info < (3, 0):
+    def utf8(value):
+        if isinstance(value, str):
+            return value.encode('utf-8')
+        else:
+            return value
+else:
+    def utf8(value):
         return value
 
 
+def imap_unordered(func, items, max_workers=4):
+    '''
+    Call `func(item)` for every item on up to `max_workers` threads and
+    yield `(item, result, error)` tuples in completion order.  `error` is
+    the raised exception (and `result` None) when the call failed.
+    '''
+    try:
+        import queue
+    except ImportError:
+        import Queue as queue
+
+    items = list(items)
+    if not items:
+        return
+    pending = queue.Queue()
+    for item in items:
+        pending.put(item)
+    done = queue.Queue()
+
+    def worker():
+        while True:
+            try:
+                item = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                done.put((item, func(item), None))
+            except Exception as e:
+                done.put((item, None, e))
+
+    for _ in range(max(1, min(max_workers, len(items)))):
+        thread = threading.Thread(target=worker, name='replyify-worker')
+        thread.daemon = True
+        thread.start()
+
+    for _ in range(len(items)):
+        yield done.get()
+
+
 def is_appengine_dev():
     return ('APPENGINE_RUNTIME' in os.environ and
             'Dev' in os.environ.get('SERVER_SOFTWARE', ''))
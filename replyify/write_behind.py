@@ -0,0 +1,131 @@
+import collections
+import threading
+import time
+
+from replyify import instrumentation, utils
+
+
+def _merge(pending, update):
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(pending.get(key), dict):
+            merged = dict(pending[key])
+            _merge(merged, value)
+            pending[key] = merged
+        else:
+            pending[key] = value
+
+
+class FlushError(object):
+
+    def __init__(self, klass, guid, params, error):
+        self.klass = klass
+        self.guid = guid
+        self.params = params
+        self.error = error
+
+    def __repr__(self):
+        return '<FlushError %s %s: %r>' % (self.klass.__name__, self.guid, self.error)
+
+
+class WriteBehindBuffer(object):
+    '''
+    Coalesces updates to the same object into a single PATCH:
+
+        buffer = WriteBehindBuffer(max_pending=200, flush_interval=2)
+        buffer.modify(replyify.Contact, guid, status='replied')
+        buffer.modify(replyify.Contact, guid, custom={'replies': 3})
+        ...
+        buffer.close()
+
+    Pending fields are merged per resource class, GUID and access token
+    (later values win, nested dicts are merged) and sent when
+    `max_pending` objects are waiting, when the oldest update is
+    `flush_interval` seconds old, or on an explicit `flush()`.  Flushes are
+    serialized, so updates to one object reach the server in order.
+
+    Failed updates are not retried; they are returned by `flush()`, passed
+    to `on_error` and emitted as `write_behind.error` events.
+    '''
+
+    def __init__(self, max_pending=100, flush_interval=5.0, max_in_flight=4, on_error=None):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.max_in_flight = max_in_flight
+        self.on_error = on_error
+        self._pending = collections.OrderedDict()
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = None
+        if flush_interval:
+            self._thread = threading.Thread(target=self._run, name='replyify-write-behind')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self._pending)
+
+    def modify(self, klass, guid, access_token=None, **params):
+        key = (klass, guid, access_token)
+        with self._lock:
+            if key not in self._pending:
+                self._pending[key] = {}
+            _merge(self._pending[key], params)
+            if self._oldest is None:
+                self._oldest = time.time()
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, collections.OrderedDict()
+                self._oldest = None
+            if not batch:
+                return []
+
+            def send(entry):
+                (klass, guid, access_token), params = entry
+                return klass.modify(guid, access_token=access_token, **params)
+
+            errors = []
+            for entry, _, error in utils.imap_unordered(send, list(batch.items()),
+                                                        max_workers=self.max_in_flight):
+                if error is None:
+                    continue
+                (klass, guid, access_token), params = entry
+                failure = FlushError(klass, guid, params, error)
+                errors.append(failure)
+                utils.logger.warning('Write-behind update of %s %s failed: %s',
+                                     klass.__name__, guid, error)
+                instrumentation.emit('write_behind.error', resource=klass.__name__,
+                                     guid=guid, error=error)
+                if self.on_error is not None:
+                    self.on_error(failure)
+
+            instrumentation.emit('write_behind.flush', objects=len(batch), errors=len(errors))
+            return errors
+
+    def close(self):
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.flush()
+
+    def _run(self):
+        while not self._closed.wait(min(self.flush_interval, 1.0)):
+            oldest = self._oldest
+            if oldest is not None and time.time() - oldest >= self.flush_interval:
+                try:
+                    self.flush()
+                except Exception:
+                    utils.logger.exception('Write-behind flush failed')
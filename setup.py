@@ -56,6 +56,12 @@ setup(
     license='MIT',
     packages=['replyify'],
     install_requires=install_requires,
+    extras_require={
+        'http2': ['httpx[http2]'],
+    },
+    entry_points={
+        'console_scripts': ['replyify = replyify.cli:main'],
+    },
     include_package_data=True,
     zip_safe=False
 )
@@ -0,0 +1,171 @@
+import datetime
+import time
+import unittest
+
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+
+import replyify
+from replyify import api, exceptions, timeouts
+
+
+class _UTC(datetime.tzinfo):
+
+    def utcoffset(self, dt):
+        return datetime.timedelta(0)
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+
+class _Ref(object):
+    replyify_guid = 'tag-123'
+
+
+class ApiEncodeTest(unittest.TestCase):
+    # Golden wire-format cases for the form encoder; the expected pairs are
+    # what the original recursive encoder produced.
+
+    def encode(self, params):
+        return list(api._api_encode(params))
+
+    def test_scalars(self):
+        self.assertEqual(self.encode({'name': 'Jane', 'count': 3, 'score': 1.5, 'active': True}),
+                         [('name', 'Jane'), ('count', 3), ('score', 1.5), ('active', True)])
+
+    def test_none_values_are_dropped(self):
+        self.assertEqual(self.encode({'a': None, 'b': 'x', 'c': {'d': None, 'e': 1}}),
+                         [('b', 'x'), ('c[e]', 1)])
+
+    def test_nested_dicts(self):
+        params = {'custom': {'company': 'Acme', 'address': {'city': 'Austin', 'zip': '78701'}}}
+        self.assertEqual(self.encode(params), [
+            ('custom[company]', 'Acme'),
+            ('custom[address][city]', 'Austin'),
+            ('custom[address][zip]', '78701'),
+        ])
+
+    def test_lists(self):
+        self.assertEqual(self.encode({'tags': ['a', 'b'], 'ids': (1, 2)}),
+                         [('tags[]', 'a'), ('tags[]', 'b'), ('ids[]', 1), ('ids[]', 2)])
+
+    def test_lists_of_dicts(self):
+        params = {'steps': [{'delay': 1, 'template': 't1'}, {'delay': 3, 'meta': {'x': 'y'}}]}
+        self.assertEqual(self.encode(params), [
+            ('steps[][delay]', 1),
+            ('steps[][template]', 't1'),
+            ('steps[][delay]', 3),
+            ('steps[][meta][x]', 'y'),
+        ])
+
+    def test_objects_with_guids(self):
+        self.assertEqual(self.encode({'tag': _Ref(), 'nested': {'tag': _Ref()}}),
+                         [('tag', 'tag-123'), ('nested[tag]', 'tag-123')])
+
+    def test_datetimes(self):
+        when = datetime.datetime(2022, 10, 5, 12, 30, tzinfo=_UTC())
+        self.assertEqual(self.encode({'send_at': when, 'window': {'start': when}}),
+                         [('send_at', 1664973000), ('window[start]', 1664973000)])
+
+    def test_wire_format(self):
+        params = {
+            'email': 'jane@example.com',
+            'custom': {'plan': 'pro'},
+            'tags': ['vip'],
+            'steps': [{'delay': 2}],
+            'skip': None,
+        }
+        self.assertEqual(
+            urlencode(self.encode(params)),
+            'email=jane%40example.com&custom%5Bplan%5D=pro&tags%5B%5D=vip&steps%5B%5D%5Bdelay%5D=2')
+
+
+class _RecordingClient(object):
+    name = 'recording'
+    connect_timeout = read_timeout = None
+
+    def __init__(self):
+        self.requests = []
+        self.timeouts = []
+
+    def request(self, method, url, headers, post_data=None, timeout=None):
+        self.requests.append((method, url, headers, post_data))
+        self.timeouts.append(timeout)
+        return '{}', 200, {}
+
+
+class RequestBodyTest(unittest.TestCase):
+
+    def send(self, params, **kwargs):
+        client = _RecordingClient()
+        api.ReplyifyApi('token', client=client, api_base='https://api.test', **kwargs).request(
+            'post', '/contact/v1', params)
+        return client.requests[0]
+
+    def test_request_format_is_case_insensitive(self):
+        _, _, headers, body = self.send({'name': 'x'}, request_format='JSON')
+        self.assertEqual(headers['Content-Type'], 'application/json')
+
+    def test_unknown_request_format_is_rejected(self):
+        self.assertRaises(ValueError, api.ReplyifyApi, 'token', client=_RecordingClient(),
+                          request_format='jsno')
+
+    def test_compression_threshold_is_inclusive_in_bytes(self):
+        params = {'name': u'\xe9' * 20}
+        _, _, headers, body = self.send(params, request_format='json', compression_threshold=1000)
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertTrue(isinstance(body, bytes))
+
+        _, _, headers, _ = self.send(params, request_format='json', compression_threshold=len(body))
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        _, _, headers, _ = self.send(params, request_format='json', compression_threshold=len(body) + 1)
+        self.assertNotIn('Content-Encoding', headers)
+
+
+class _SlowQueue(object):
+    # A request_scheduler / concurrency_limiter that keeps callers queued.
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.released = 0
+
+    def acquire(self, *args):
+        time.sleep(self.seconds)
+
+    def release(self):
+        self.released += 1
+
+    def on_response(self, rcode, rheaders):
+        pass
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = _RecordingClient()
+        self.api = api.ReplyifyApi('token', client=self.client, api_base='https://api.test')
+
+    def tearDown(self):
+        replyify.request_scheduler = None
+        replyify.concurrency_limiter = None
+
+    def test_request_queued_past_its_deadline_is_not_sent(self):
+        replyify.request_scheduler = queue = _SlowQueue(0.05)
+        with timeouts.Deadline(0.01):
+            self.assertRaises(exceptions.DeadlineExceededException,
+                              self.api.request, 'get', '/contact/v1')
+        self.assertEqual(self.client.requests, [])
+        self.assertEqual(queue.released, 1)
+
+    def test_time_spent_queued_shortens_the_timeout(self):
+        replyify.concurrency_limiter = _SlowQueue(0.1)
+        with timeouts.Deadline(1):
+            self.api.request('get', '/contact/v1')
+        connect, read = self.client.timeouts[0]
+        self.assertLessEqual(read, 0.9)
+
+    def test_retry_after_is_capped(self):
+        self.assertEqual(self.api._retry_delay(0, {'retry-after': '86400'}), api.MAX_RETRY_AFTER)
+        self.assertLessEqual(self.api._retry_delay(0, {'retry-after': '-1'}), 0.5)
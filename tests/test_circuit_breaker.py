@@ -0,0 +1,51 @@
+import time
+import unittest
+
+import replyify
+from replyify import api, circuit_breaker, exceptions, timeouts
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_outcomes_from_an_older_generation_are_ignored(self):
+        breaker = circuit_breaker.CircuitBreaker('https://api.test', failure_threshold=1,
+                                                 reset_timeout=0)
+        first = breaker.before_request()
+        late = breaker.before_request()
+        breaker.record_failure(first)
+        self.assertEqual(breaker.state, circuit_breaker.OPEN)
+
+        probe = breaker.before_request()
+        self.assertEqual(breaker.state, circuit_breaker.HALF_OPEN)
+        breaker.record_success(late)
+        breaker.record_failure(late)
+        self.assertEqual(breaker.state, circuit_breaker.HALF_OPEN)
+        breaker.record_success(probe)
+        self.assertEqual(breaker.state, circuit_breaker.CLOSED)
+
+
+class _TimingOutClient(object):
+    name = 'timing-out'
+    connect_timeout = read_timeout = 30
+
+    def request(self, method, url, headers, post_data=None, timeout=None):
+        time.sleep(timeout[1])
+        raise exceptions.APIConnectionException('Request timed out')
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        replyify.circuit_breaker_settings = {'failure_threshold': 1}
+
+    def tearDown(self):
+        replyify.circuit_breaker_settings = None
+        circuit_breaker.reset()
+
+    def test_deadline_clipped_timeout_is_not_a_host_failure(self):
+        requestor = api.ReplyifyApi('token', client=_TimingOutClient(), api_base='https://api.test')
+        with timeouts.Deadline(0.05):
+            self.assertRaises(exceptions.DeadlineExceededException,
+                              requestor.request, 'get', '/contact/v1')
+        breaker = circuit_breaker.breaker_for('https://api.test')
+        self.assertEqual(breaker.state, circuit_breaker.CLOSED)
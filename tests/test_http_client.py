@@ -0,0 +1,124 @@
+import threading
+import time
+import unittest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from replyify import http_client
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        self.server.cookies.append(self.headers.get('Cookie'))
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Set-Cookie', 'session=%s; Path=/' % self.headers.get('Authorization'))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipIf(requests is None, 'requests is not installed')
+class RequestsClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.lock = threading.Lock()
+        self.server.connections = 0
+        self.server.cookies = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+        self.client = http_client.RequestsClient(verify_ssl_certs=False, pool_maxsize=4)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def connections(self, expected):
+        # Connections are counted by the handler threads, a moment after
+        # the client sees them open.
+        deadline = time.time() + 2
+        while self.server.connections < expected and time.time() < deadline:
+            time.sleep(0.01)
+        return self.server.connections
+
+    def get(self, token):
+        return self.client.request('get', self.url, {'Authorization': token})
+
+    def test_cookies_are_not_shared_between_requests(self):
+        self.get('a')
+        self.get('b')
+        self.assertEqual(self.server.cookies, [None, None])
+
+    def test_warm_up_opens_reusable_connections(self):
+        self.assertEqual(self.client.warm_up(n_connections=3, url=self.url), 3)
+        self.assertEqual(self.connections(3), 3)
+        for token in 'abc':
+            self.get(token)
+        time.sleep(0.1)
+        self.assertEqual(self.server.connections, 3)
+
+    def test_warm_up_failure_returns_slots(self):
+        # Stop serving first: a listening socket still being polled by
+        # serve_forever keeps accepting connections after it is closed.
+        self.server.shutdown()
+        self.server.server_close()
+        self.assertEqual(self.client.warm_up(n_connections=3, url=self.url), 0)
+        adapter = self.client._get_session().get_adapter(self.url)
+        pool = adapter.poolmanager.connection_from_url(self.url)
+        self.assertEqual(pool.pool.qsize(), 4)
+
+
+class _Backend(object):
+    # A minimal custom client: no timeouts, close() or warm_up() of its own.
+    name = 'custom'
+
+    def request(self, method, url, headers, post_data=None, timeout=None):
+        return '{}', 200, {}
+
+
+class FaultInjectionClientTest(unittest.TestCase):
+
+    def test_wraps_a_backend_without_timeouts(self):
+        client = http_client.FaultInjectionClient(_Backend())
+        self.assertEqual(client.request('get', 'https://api.test/contact/v1', {}), ('{}', 200, {}))
+        self.assertEqual(client.warm_up(), 0)
+        client.close()
+
+    def test_forwards_close_and_warm_up(self):
+        calls = []
+        backend = _Backend()
+        backend.close = lambda: calls.append('close')
+        backend.warm_up = lambda n_connections, url: calls.append(('warm_up', n_connections, url)) or 2
+        client = http_client.FaultInjectionClient(backend)
+        self.assertEqual(client.warm_up(3, 'https://api.test'), 2)
+        client.close()
+        self.assertEqual(calls, [('warm_up', 3, 'https://api.test'), 'close'])
@@ -0,0 +1,47 @@
+import gc
+import threading
+import unittest
+
+from replyify import instrumentation
+from replyify.indexes import IndexedCollection
+from replyify.resources import Tag
+
+
+def _tag(guid, name):
+    return Tag.construct_from({'guid': guid, 'name': name}, 'token')
+
+
+class IndexedCollectionTest(unittest.TestCase):
+
+    def test_saves_update_the_indexes(self):
+        tags = IndexedCollection([_tag('t1', 'old')], index_on=('guid', 'name'))
+        instrumentation.emit('resource.saved', resource=_tag('t1', 'new'))
+        self.assertIsNone(tags.get('name', 'old'))
+        self.assertEqual(tags.get('name', 'new')['guid'], 't1')
+        tags.close()
+
+    def test_listener_is_removed_when_the_collection_dies(self):
+        before = len(instrumentation._listeners)
+        tags = IndexedCollection([_tag('t1', 'a')])
+        self.assertEqual(len(instrumentation._listeners), before + 1)
+        del tags
+        gc.collect()
+        self.assertEqual(len(instrumentation._listeners), before)
+
+    def test_concurrent_updates_keep_the_indexes_consistent(self):
+        tags = IndexedCollection([_tag('t%d' % i, 'n0') for i in range(50)], index_on=('name',))
+
+        def save(start):
+            for n in range(200):
+                for i in range(start, 50, 4):
+                    instrumentation.emit('resource.saved', resource=_tag('t%d' % i, 'n%d' % (n % 3)))
+
+        threads = [threading.Thread(target=save, args=(start,)) for start in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        indexed = sum(len(tags.find('name', 'n%d' % n)) for n in range(3))
+        self.assertEqual(indexed, 50)
+        tags.close()
@@ -0,0 +1,65 @@
+import time
+import unittest
+
+from replyify import exceptions, timeouts
+from replyify.rate_limit import AdaptiveConcurrencyLimiter, TokenBucket
+
+
+class AdaptiveConcurrencyLimiterTest(unittest.TestCase):
+
+    def respond(self, limiter, rcode, headers=None):
+        limiter.release()
+        limiter.on_response(rcode, headers or {})
+
+    def test_burst_of_429s_decreases_once(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=8)
+        for _ in range(8):
+            limiter.acquire()
+        for _ in range(8):
+            self.respond(limiter, 429)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_new_window_decreases_again(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=8)
+        for _ in range(3):
+            limiter.acquire()
+        for _ in range(3):
+            self.respond(limiter, 429)
+        limiter.acquire()
+        self.respond(limiter, 429)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_low_watermark_burst_decreases_once(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=16, low_watermark=0.1)
+        headers = {'X-RateLimit-Remaining': '5', 'X-RateLimit-Limit': '100'}
+        for _ in range(10):
+            limiter.acquire()
+        for _ in range(10):
+            self.respond(limiter, 200, headers)
+        self.assertEqual(limiter.limit, 8)
+
+    def test_success_grows_additively(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=4)
+        for _ in range(4):
+            limiter.acquire()
+            self.respond(limiter, 200)
+        self.assertGreater(limiter.limit, 4.9)
+        self.assertLess(limiter.limit, 5.1)
+
+    def test_wait_is_bounded_by_the_deadline(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=1)
+        limiter.acquire()
+        with timeouts.Deadline(0.05):
+            self.assertRaises(exceptions.DeadlineExceededException, limiter.acquire)
+        self.assertEqual(limiter.in_flight, 1)
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_wait_is_bounded_by_the_deadline(self):
+        bucket = TokenBucket(rate=0.01, burst=1)
+        bucket.acquire()
+        started = time.time()
+        with timeouts.Deadline(0.05):
+            self.assertRaises(exceptions.DeadlineExceededException, bucket.acquire)
+        self.assertLess(time.time() - started, 1)
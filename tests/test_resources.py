@@ -0,0 +1,80 @@
+import datetime
+import unittest
+
+from replyify import resources
+
+
+class ShardWindowsTest(unittest.TestCase):
+
+    def assert_tiles(self, windows, start, end):
+        self.assertEqual(windows[0][0], start)
+        self.assertEqual(windows[-1][1], end)
+        for (lower, upper), (next_lower, _) in zip(windows, windows[1:]):
+            self.assertEqual(upper, next_lower)
+        for lower, upper in windows:
+            self.assertTrue(isinstance(lower, int) and isinstance(upper, int))
+            self.assertLess(lower, upper)
+
+    def test_windows_are_contiguous_and_disjoint(self):
+        for start, end, shards in [(1600000000, 1600000010, 3), (0, 7, 7), (5, 1000003, 8)]:
+            windows = resources._shard_windows(start, end, shards)
+            self.assertEqual(len(windows), shards)
+            self.assert_tiles(windows, start, end)
+
+    def test_fractional_bounds_are_widened_to_whole_seconds(self):
+        windows = resources._shard_windows(1600000000.5, 1600000003.2, 3)
+        self.assert_tiles(windows, 1600000000, 1600000004)
+
+    def test_no_more_windows_than_seconds(self):
+        windows = resources._shard_windows(100, 103, 8)
+        self.assertEqual(windows, [(100, 101), (101, 102), (102, 103)])
+
+    def test_datetime_bounds(self):
+        start = datetime.datetime(2022, 1, 1)
+        end = datetime.datetime(2022, 1, 2)
+        windows = resources._shard_windows(start, end, 4)
+        self.assertEqual(windows[-1][1] - windows[0][0], 86400)
+        self.assert_tiles(windows, windows[0][0], windows[-1][1])
+
+
+class AwaitableAPIResourceTest(unittest.TestCase):
+
+    def job(self, **values):
+        return resources.TimelineJob.construct_from(dict(values, guid='job_1'), 'token')
+
+    def test_terminal_statuses_are_complete(self):
+        self.assertTrue(self.job(status='completed').is_complete())
+        self.assertTrue(self.job(status='FAILED').is_complete())
+
+    def test_missing_or_unknown_status_is_pending(self):
+        self.assertFalse(self.job(state='running').is_complete())
+        self.assertFalse(self.job(status='running').is_complete())
+        self.assertFalse(self.job(status='paused').is_complete())
+
+    def test_status_field_can_be_overridden(self):
+        class Job(resources.TimelineJob):
+            status_field = 'state'
+            complete_statuses = frozenset(['finished'])
+
+        job = Job.construct_from({'guid': 'job_1', 'state': 'finished'}, 'token')
+        self.assertTrue(job.is_complete())
+        self.assertFalse(self.job(status='finished').is_complete())
+
+
+class ShardedIterTest(unittest.TestCase):
+
+    def test_items_are_delivered_once(self):
+        class Contact(resources.Contact):
+            @classmethod
+            def auto_paging_iter(cls, deadline=None, **params):
+                lower, upper = params['created__gte'], params['created__lt']
+                for created in range(lower, upper):
+                    item = {'guid': 'c%d' % created, 'created': created}
+                    # A page boundary moving under concurrent writes repeats
+                    # an item within its window.
+                    yield item
+                    yield item
+
+        items = list(Contact.sharded_iter(0, 100, shards=4))
+        self.assertEqual(sorted(item['guid'] for item in items),
+                         sorted('c%d' % created for created in range(100)))
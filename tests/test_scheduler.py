@@ -0,0 +1,25 @@
+import time
+import unittest
+
+from replyify import exceptions, scheduler, timeouts
+
+
+class PrioritySchedulerTest(unittest.TestCase):
+
+    def test_wait_is_bounded_by_the_deadline(self):
+        dispatcher = scheduler.PriorityScheduler(max_concurrency=1)
+        dispatcher.acquire(scheduler.HIGH)
+        started = time.time()
+        with timeouts.Deadline(0.05):
+            self.assertRaises(exceptions.DeadlineExceededException, dispatcher.acquire, scheduler.LOW)
+        self.assertLess(time.time() - started, 1)
+
+        dispatcher.release()
+        dispatcher.acquire(scheduler.LOW)
+        self.assertEqual(dispatcher._waiting, [])
+
+    def test_free_slot_is_taken_without_waiting(self):
+        dispatcher = scheduler.PriorityScheduler(max_concurrency=1)
+        with timeouts.Deadline(0):
+            dispatcher.acquire()
+        self.assertEqual(dispatcher._in_flight, 1)
@@ -0,0 +1,41 @@
+import unittest
+
+from replyify.tenants import ClientRegistry
+
+
+class _Client(object):
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ClientRegistryTest(unittest.TestCase):
+
+    def registry(self, **kwargs):
+        return ClientRegistry(max_concurrency=None, client_factory=_Client, **kwargs)
+
+    def test_evicts_least_recently_used_idle_tenant(self):
+        registry = self.registry(max_tenants=1)
+        a = registry.tenant('A')
+        b = registry.tenant('B')
+        self.assertTrue(a.client.closed)
+        self.assertFalse(b.client.closed)
+        self.assertEqual(list(registry.metrics()), ['B'])
+
+    def test_busy_tenants_keep_new_tenant(self):
+        registry = self.registry(max_tenants=1)
+        a = registry.tenant('A')
+        a.acquire()
+        b = registry.tenant('B')
+        self.assertFalse(a.client.closed)
+        self.assertFalse(b.client.closed)
+        self.assertEqual(sorted(registry.metrics()), ['A', 'B'])
+        self.assertIs(registry.tenant('B'), b)
+
+        a.release(0.1)
+        registry.tenant('B')
+        self.assertTrue(a.client.closed)
+        self.assertEqual(list(registry.metrics()), ['B'])
@@ -0,0 +1,20 @@
+import unittest
+
+from replyify import timeline_view
+
+
+class ContactTimelineTest(unittest.TestCase):
+
+    def test_items_without_created_merge_with_timestamps(self):
+        timeline = timeline_view._ContactTimeline(max_items=10)
+        timeline.add([{'guid': 'b', 'created': '2022-10-02T00:00:00Z'},
+                      {'guid': 'a'}])
+        timeline.add([{'guid': 'c', 'created': '2022-10-01T00:00:00Z'},
+                      {'guid': 'd', 'created': None}])
+        self.assertEqual([item['guid'] for item in timeline.items], ['a', 'd', 'c', 'b'])
+
+    def test_keeps_the_newest_items(self):
+        timeline = timeline_view._ContactTimeline(max_items=2)
+        timeline.add([{'guid': 'g%d' % i, 'created': i} for i in range(5)])
+        timeline.add([{'guid': 'g1', 'created': 1}])
+        self.assertEqual([item['guid'] for item in timeline.items], ['g3', 'g4'])